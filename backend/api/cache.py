@@ -0,0 +1,247 @@
+import hashlib
+import time
+from collections import namedtuple
+
+import orjson
+from django.core.cache import cache
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription, Tag
+
+from .constants import (COUNT_TIMEOUT, RECIPE_PAYLOAD_TIMEOUT,
+                        SHOPPING_CART_TIMEOUT, SHORT_LINK_TIMEOUT,
+                        STATUS_SETS_TIMEOUT, TAG_MAP_CACHE_KEY,
+                        TAG_MAP_TIMEOUT)
+from .metrics import record_cache
+
+StatusSets = namedtuple(
+    'StatusSets', ('version', 'favorites', 'shopping_cart', 'subscriptions'))
+
+
+def get_version(key):
+    """Возвращает метку версии, создавая её при отсутствии в кеше."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    cache.set(key, time.time_ns(), None)
+
+
+def bump_versions(keys):
+    version = time.time_ns()
+    cache.set_many({key: version for key in keys}, None)
+
+
+def surrogate_version_key(surrogate_key):
+    return f'surrogate:{surrogate_key}'
+
+
+def get_surrogate_versions(surrogate_keys, default=None):
+    """Текущие версии суррогатных ключей; отсутствующие создаются
+       с версией default или текущим временем.
+    """
+    keys = [surrogate_version_key(key) for key in surrogate_keys]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = default or time.time_ns()
+        cache.set_many({key: version for key in missing}, None)
+        versions.update(dict.fromkeys(missing, version))
+    return {
+        surrogate_key: versions[key]
+        for surrogate_key, key in zip(surrogate_keys, keys)}
+
+
+def purge_surrogate_keys(surrogate_keys):
+    """Делает устаревшими все закешированные ответы с этими ключами."""
+    bump_versions(surrogate_version_key(key) for key in surrogate_keys)
+
+
+def get_tag_map():
+    """Возвращает закешированный словарь slug -> id всех тегов."""
+    tag_map = cache.get(TAG_MAP_CACHE_KEY)
+    record_cache('tag_map', tag_map is not None)
+    if tag_map is None:
+        tag_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(TAG_MAP_CACHE_KEY, tag_map, TAG_MAP_TIMEOUT)
+    return tag_map
+
+
+def invalidate_tag_map():
+    cache.delete(TAG_MAP_CACHE_KEY)
+
+
+def short_link_key(short_link):
+    return f'short-link:{short_link}'
+
+
+def get_short_link_target(short_link):
+    """id рецепта по короткой ссылке или None, если рецепта нет."""
+    key = short_link_key(short_link)
+    recipe_id = cache.get(key)
+    record_cache('short_link', recipe_id is not None)
+    if recipe_id is None:
+        recipe_id = Recipe.objects.filter(
+            short_link=short_link).values_list('id', flat=True).first()
+        if recipe_id is not None:
+            cache.set(key, recipe_id, SHORT_LINK_TIMEOUT)
+    return recipe_id
+
+
+def warm_short_links(chunk_size=1000):
+    """Заполняет кеш коротких ссылок всех рецептов."""
+    links = {}
+    for short_link, recipe_id in Recipe.objects.values_list(
+            'short_link', 'id').iterator(chunk_size=chunk_size):
+        links[short_link_key(short_link)] = recipe_id
+        if len(links) == chunk_size:
+            cache.set_many(links, SHORT_LINK_TIMEOUT)
+            links = {}
+    cache.set_many(links, SHORT_LINK_TIMEOUT)
+
+
+def load_status_sets(user_id, version):
+    return StatusSets(
+        version,
+        frozenset(Favorite.objects.filter(
+            user_id=user_id).values_list('recipe_id', flat=True)),
+        frozenset(ShoppingCart.objects.filter(
+            user_id=user_id).values_list('recipe_id', flat=True)),
+        frozenset(Subscription.objects.filter(
+            user_id=user_id).values_list('subscribed_to_id', flat=True)))
+
+
+def status_sets_version_key(user_id):
+    return f'status-sets:{user_id}:version'
+
+
+def get_status_sets_version(user_id):
+    return get_version(status_sets_version_key(user_id))
+
+
+def get_status_sets(request):
+    """Множества id избранных рецептов, рецептов в списке покупок и
+       авторов в подписках текущего пользователя.
+
+    Множества хранятся в кеше под текущей версией пользователя и
+    запоминаются в запросе, так что на запрос приходится не больше одного
+    обращения к кешу.
+    """
+    status_sets = getattr(request, 'status_sets', None)
+    if status_sets is not None:
+        return status_sets
+    user_id = request.user.pk
+    version = get_status_sets_version(user_id)
+    key = f'status-sets:{user_id}:{version}'
+    status_sets = cache.get(key)
+    record_cache('status_sets', status_sets is not None)
+    if status_sets is None:
+        status_sets = load_status_sets(user_id, version)
+        cache.set(key, status_sets, STATUS_SETS_TIMEOUT)
+    request.status_sets = status_sets
+    return status_sets
+
+
+def invalidate_status_sets(request):
+    """Сбрасывает множества после изменения избранного, списка покупок
+       или подписок пользователя.
+    """
+    bump_version(status_sets_version_key(request.user.pk))
+    request.status_sets = None
+
+
+def get_cached_count(queryset, user_id=None):
+    """Точное число объектов queryset, закешированное на COUNT_TIMEOUT.
+
+    Ключ строится по SQL и параметрам запроса. Для пользователя в ключ
+    входит версия его множеств статусов, так что после изменения
+    избранного, списка покупок или подписок число считается заново.
+    """
+    sql, params = queryset.query.sql_with_params()
+    key = 'count:' + hashlib.md5(f'{sql}\n{params!r}'.encode()).hexdigest()
+    if user_id is not None:
+        version = get_status_sets_version(user_id)
+        key = f'{key}:{user_id}:{version}'
+    count = cache.get(key)
+    record_cache('count', count is not None)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+def recipe_payload_key(request, recipe_id, version):
+    return f'recipe:{recipe_id}:{version}:{request.get_host()}'
+
+
+def get_recipe_payload(request, recipe_id, version):
+    """Общее для всех пользователей представление рецепта версии version
+       (Recipe.version) или None.
+    """
+    payload = cache.get(recipe_payload_key(request, recipe_id, version))
+    record_cache('recipe_payload', payload is not None)
+    if payload is None:
+        return None
+    return orjson.loads(payload)
+
+
+def set_recipe_payload(request, recipe_id, version, data):
+    cache.set(
+        recipe_payload_key(request, recipe_id, version), orjson.dumps(data),
+        RECIPE_PAYLOAD_TIMEOUT)
+
+
+def invalidate_recipes(recipe_ids):
+    """Сбрасывает закешированные ответы, где есть эти рецепты.
+
+    Представления самих рецептов сбрасывать не нужно: они хранятся под
+    Recipe.version, который меняется вместе с рецептом.
+    """
+    purge_surrogate_keys(
+        ['recipes', *(f'recipe:{recipe_id}' for recipe_id in recipe_ids)])
+
+
+def shopping_cart_version_key(user_id):
+    return f'shopping-cart:{user_id}:version'
+
+
+def get_shopping_cart_version(user_id):
+    """Версия списка покупок: меняется вместе с его содержимым."""
+    return get_version(shopping_cart_version_key(user_id))
+
+
+def invalidate_shopping_carts(user_ids):
+    bump_versions(shopping_cart_version_key(user_id) for user_id in user_ids)
+
+
+def shopping_cart_file_key(user_id, version, file_format):
+    return f'shopping-cart:{user_id}:{version}:{file_format}'
+
+
+def get_shopping_cart_file(user_id, version, file_format):
+    """Готовый файл списка покупок или None."""
+    content = cache.get(shopping_cart_file_key(user_id, version, file_format))
+    record_cache('shopping_cart', content is not None)
+    return content
+
+
+def set_shopping_cart_file(user_id, version, file_format, content):
+    cache.set(
+        shopping_cart_file_key(user_id, version, file_format), content,
+        SHOPPING_CART_TIMEOUT)
+
+
+def apply_statuses(request, data):
+    """Проставляет в представление рецепта флаги текущего пользователя."""
+    if request.user.is_authenticated:
+        status_sets = get_status_sets(request)
+        data['is_favorited'] = data['id'] in status_sets.favorites
+        data['is_in_shopping_cart'] = data['id'] in status_sets.shopping_cart
+        data['author']['is_subscribed'] = (
+            data['author']['id'] in status_sets.subscriptions)
+    else:
+        data['is_favorited'] = data['is_in_shopping_cart'] = False
+        data['author']['is_subscribed'] = False
+    return data
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Ограничения частоты и числа одновременных запросов, версии и
+       множества статусов хранятся в кеше и работают только при общем
+       для всех процессов кеше.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if not backend.endswith(('LocMemCache', 'DummyCache')):
+        return []
+    return [Warning(
+        f'{backend} is not shared between processes: throttling, '
+        'concurrency limits and cache invalidation only work within '
+        'a single process.',
+        hint='Use a shared cache (Redis, Memcached or DatabaseCache) '
+             'when running more than one worker.',
+        id='api.W001')]
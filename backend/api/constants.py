@@ -10,3 +10,26 @@ NAME_TAG_MAX_LENGTH = 32
 SLUG_MAX_LENGTH = 32
 NAME_RECIPE_MAX_LENGTH = 256
 SHORT_LINK_MAX_LENGTH = 5
+BULK_MAX_SIZE = 100
+TAG_MASK_BITS = 63
+TAG_MAP_CACHE_KEY = 'tags:slug-map'
+TAG_MAP_TIMEOUT = 60 * 60
+INGREDIENT_INDEX_VERSION_KEY = 'search:ingredient-index:version'
+RECIPE_NAME_INDEX_VERSION_KEY = 'search:recipe-name-index:version'
+RECIPE_NAME_INDEX_MAX_AGE = 10 * 60
+LOCAL_INDEX_DELTA_TIMEOUT = 60 * 60
+LOCAL_INDEX_MAX_DELTAS = 1000
+LOCAL_INDEX_DELTA_WAIT = 5
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+RECOMMENDATIONS_TOP_K = 10
+FAVORITE_WEIGHT = 1.0
+SHOPPING_CART_WEIGHT = 0.5
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_MIN_SCORE = 1e-3
+STATUS_SETS_TIMEOUT = 10 * 60
+RECIPE_PAYLOAD_TIMEOUT = 60 * 60
+SHORT_LINK_TIMEOUT = 24 * 60 * 60
+SHOPPING_CART_FORMATS = {'txt': 'text/plain', 'csv': 'text/csv'}
+SHOPPING_CART_TIMEOUT = 24 * 60 * 60
+COUNT_TIMEOUT = 60
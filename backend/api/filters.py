@@ -1,15 +1,26 @@
 import django_filters
-from recipes.models import Ingredient, Recipe, Tag
+from django.db.models import F
+from recipes.models import Ingredient, Recipe
+
+from .cache import get_tag_map
+from .constants import TAG_MASK_BITS
+from .utils import get_tags_mask
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_map()]
 
 
 class RecipeFilter(django_filters.FilterSet):
     is_favorited = django_filters.NumberFilter(method='is_favorited_filter')
     is_in_shopping_cart = django_filters.NumberFilter(
         method='is_in_shopping_cart_filter')
-    tags = django_filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all())
+    tags = django_filters.MultipleChoiceFilter(
+        choices=tag_choices, method='tags_filter')
+    tags_mode = django_filters.ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')), method='skip_filter')
+    ordering = django_filters.ChoiceFilter(
+        choices=(('trending', 'trending'),), method='ordering_filter')
 
     class Meta:
         model = Recipe
@@ -25,6 +36,36 @@ class RecipeFilter(django_filters.FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def tags_filter(self, queryset, name, value):
+        """Фильтрует рецепты по тегам: по умолчанию подходит любой из тегов,
+           при tags_mode=all — только рецепты со всеми тегами сразу.
+
+        Условие по маске заменяет соединение с таблицей тегов, но индексом
+        не поддерживается: рецепты проверяются последовательным чтением.
+        Маску заполняют сигналы и, для старых рецептов, migrate или
+        команда rebuild_tags_mask.
+        """
+        tag_map = get_tag_map()
+        tag_ids = [tag_map[slug] for slug in value if slug in tag_map]
+        match_all = self.form.cleaned_data.get('tags_mode') == 'all'
+        if any(tag_id > TAG_MASK_BITS for tag_id in tag_ids):
+            if not match_all:
+                return queryset.filter(tags__in=tag_ids).distinct()
+            for tag_id in tag_ids:
+                queryset = queryset.filter(tags=tag_id)
+            return queryset
+        mask = get_tags_mask(tag_ids)
+        queryset = queryset.alias(tags_match=F('tags_mask').bitand(mask))
+        if match_all:
+            return queryset.filter(tags_match=mask)
+        return queryset.exclude(tags_match=0)
+
+    def ordering_filter(self, queryset, name, value):
+        return queryset.order_by('-trending_score', '-pub_date')
+
+    def skip_filter(self, queryset, name, value):
+        return queryset
+
 
 class IngredientFilter(django_filters.FilterSet):
     """Фильтрует ингредиенты по полю name."""
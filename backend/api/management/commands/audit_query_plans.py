@@ -0,0 +1,181 @@
+import json
+import re
+import time
+
+from api.constants import PAGE_SIZE
+from api.utils import shopping_cart_ingredients
+from api.views import IngredientViewSet, RecipeViewSet, UserViewSet
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+User = get_user_model()
+
+EXPECTED_INDEXES = (
+    (Recipe, ('pub_date',)),
+    (Recipe, ('author', 'pub_date')),
+    (Ingredient, ('name',)),
+)
+
+PLAN_PROBLEMS = {
+    'postgresql': (
+        (re.compile(r'Seq Scan on (\w+)'), 'seq scan on {}'),
+        (re.compile(r'Sort Method: external'), 'sort spilled to disk'),
+    ),
+    'sqlite': (
+        (re.compile(r'\bSCAN (\w+)\b(?! USING)'), 'seq scan on {}'),
+        (re.compile(r'USE TEMP B-TREE FOR (.+)'), 'temp b-tree for {}'),
+    ),
+}
+
+
+def view_queryset(viewset, action, user, params=None):
+    """Queryset, который вьюсет построит для запроса с params."""
+    request = Request(APIRequestFactory().get('/', params or {}))
+    request.user = user
+    view = viewset(
+        action=action, request=request, kwargs={}, format_kwarg=None)
+    return view.filter_queryset(view.get_queryset())
+
+
+def plan_problems(plan):
+    problems = []
+    for pattern, message in PLAN_PROBLEMS.get(connection.vendor, ()):
+        for match in pattern.finditer(plan):
+            problem = message.format(*match.groups())
+            if problem not in problems:
+                problems.append(problem)
+    return problems
+
+
+def missing_indexes():
+    """Индексы из EXPECTED_INDEXES, которых нет в базе."""
+    missing = []
+    with connection.cursor() as cursor:
+        for model, fields in EXPECTED_INDEXES:
+            table = model._meta.db_table
+            columns = [model._meta.get_field(name).column for name in fields]
+            constraints = connection.introspection.get_constraints(
+                cursor, table)
+            if not any(
+                    (constraint['index'] or constraint['unique'])
+                    and constraint['columns'][:len(columns)] == columns
+                    for constraint in constraints.values()):
+                missing.append(f'{table}({", ".join(columns)})')
+    return missing
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the querysets behind hot API endpoints and flag "
+        "sequential scans, disk sorts and missing indexes")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='Id of the user for personal queries, defaults to the first')
+        parser.add_argument(
+            '--output', help='Write the JSON report to this file')
+        parser.add_argument(
+            '--compare', help='JSON report of a previous run to compare with')
+
+    def get_queries(self, user):
+        recipes = Recipe.objects.all()
+        tag = Tag.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        recipe = recipes.order_by('id').first()
+        queries = [
+            ('recipes', {}),
+            ('recipes: author', {'author': user.id}),
+            ('recipes: is_favorited', {'is_favorited': 1}),
+            ('recipes: is_in_shopping_cart', {'is_in_shopping_cart': 1}),
+            ('recipes: ordering=trending', {'ordering': 'trending'}),
+        ]
+        if tag:
+            queries += [
+                ('recipes: tags', {'tags': tag.slug}),
+                ('recipes: tags_mode=all',
+                 {'tags': tag.slug, 'tags_mode': 'all'}),
+            ]
+        for name, params in queries:
+            yield name, view_queryset(
+                RecipeViewSet, 'list', user, params)[:PAGE_SIZE]
+        yield 'subscriptions', view_queryset(
+            UserViewSet, 'subscriptions', user)[:PAGE_SIZE]
+        yield 'shopping cart', shopping_cart_ingredients(user)
+        if ingredient:
+            yield 'ingredients: name', view_queryset(
+                IngredientViewSet, 'list', user,
+                {'name': ingredient.name[:3]})
+        if recipe:
+            yield 'short link', recipes.filter(short_link=recipe.short_link)
+
+    def audit(self, name, queryset):
+        options = {}
+        if connection.vendor == 'postgresql':
+            options = {'analyze': True, 'buffers': True}
+        plan = queryset.explain(**options)
+        started = time.perf_counter()
+        list(queryset)
+        elapsed = (time.perf_counter() - started) * 1000
+        return {
+            'name': name,
+            'sql': str(queryset.query),
+            'plan': plan,
+            'problems': plan_problems(plan),
+            'time_ms': round(elapsed, 3),
+        }
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to run personal queries for')
+
+        report = {
+            'vendor': connection.vendor,
+            'queries': [self.audit(name, queryset)
+                        for name, queryset in self.get_queries(user)],
+            'missing_indexes': missing_indexes(),
+        }
+        for query in report['queries']:
+            self.stdout.write(
+                f'{query["name"]:<32}{query["time_ms"]:9.3f} ms  '
+                + (', '.join(query['problems']) or 'ok'))
+        for index in report['missing_indexes']:
+            self.stdout.write(self.style.WARNING(f'missing index {index}'))
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.compare(json.load(file), report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def compare(self, previous, report):
+        """Выводит проблемы, появившиеся и исчезнувшие с прошлого запуска."""
+        before = {query['name']: query for query in previous['queries']}
+        self.stdout.write(f'Compared with the {previous["vendor"]} report:')
+        for query in report['queries']:
+            old = before.get(query['name'])
+            if old is None:
+                self.stdout.write(f'  {query["name"]}: new query')
+                continue
+            added = set(query['problems']) - set(old['problems'])
+            fixed = set(old['problems']) - set(query['problems'])
+            self.stdout.write(
+                f'  {query["name"]}: {old["time_ms"]:.3f} -> '
+                f'{query["time_ms"]:.3f} ms'
+                + ''.join(f', +{problem}' for problem in sorted(added))
+                + ''.join(f', -{problem}' for problem in sorted(fixed)))
+        for index in set(previous['missing_indexes']) - set(
+                report['missing_indexes']):
+            self.stdout.write(f'  index {index} added')
+        for index in set(report['missing_indexes']) - set(
+                previous['missing_indexes']):
+            self.stdout.write(f'  index {index} missing')
@@ -0,0 +1,75 @@
+import time
+
+import brotli
+from api.renderers import ORJSONRenderer
+from api.views import RecipeViewSet
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+
+def measure(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare JSON encoders and response compression "
+        "on a /api/recipes/ page")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, action='append', dest='limits',
+            help='Page size to benchmark, may be repeated')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Runs per measurement')
+        parser.add_argument(
+            '--host', default='localhost',
+            help='Host from ALLOWED_HOSTS used to build image URLs')
+
+    def handle(self, *args, **options):
+        limits = options['limits'] or (6, 100, 1000)
+        # Страница нужна целиком в response.data, без потоковой отдачи.
+        with override_settings(STREAMING_PAGE_SIZE=max(limits) + 1):
+            self.benchmark(limits, options)
+
+    def benchmark(self, limits, options):
+        view = RecipeViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        for limit in limits:
+            request = factory.get(
+                '/api/recipes/', {'limit': limit},
+                HTTP_HOST=options['host'])
+            data = view(request).data
+            self.stdout.write(
+                f'/api/recipes/?limit={limit} '
+                f'({len(data["results"])} recipes)')
+
+            encoded = {}
+            for name, renderer in (('json', JSONRenderer()),
+                                   ('orjson', ORJSONRenderer())):
+                elapsed, encoded[name] = measure(
+                    lambda: renderer.render(data), options['repeat'])
+                self.stdout.write(
+                    f'  encode {name:<8}{elapsed:9.3f} ms '
+                    f'{len(encoded[name]):10d} bytes')
+
+            content = encoded['orjson']
+            for name, compress in (
+                    ('gzip', compress_string),
+                    ('br', lambda content: brotli.compress(
+                        content,
+                        quality=settings.COMPRESSION_BROTLI_QUALITY))):
+                elapsed, compressed = measure(
+                    lambda: compress(content), options['repeat'])
+                saved = 100 - len(compressed) * 100 / max(len(content), 1)
+                self.stdout.write(
+                    f'  compress {name:<6}{elapsed:9.3f} ms '
+                    f'{len(compressed):10d} bytes, {saved:.1f}% saved')
@@ -0,0 +1,215 @@
+import numpy as np
+from api.constants import (FAVORITE_WEIGHT, RECOMMENDATIONS_TOP_K,
+                           SHOPPING_CART_WEIGHT)
+from api.utils import values_array
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from recipes.models import (Favorite, IngredientRecipe, PrecomputeMark,
+                            Recipe, RecommendedRecipe, ShoppingCart,
+                            SimilarRecipe)
+from scipy import sparse
+
+User = get_user_model()
+
+MARK_NAME = 'recommendations'
+
+
+def normalize_rows(matrix):
+    """Нормирует строки разреженной матрицы на единичную длину."""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def lock_existing(model, ids):
+    """id объектов, которые ещё есть в базе. Строки блокируются от
+       удаления до конца транзакции.
+    """
+    return set(model.objects.select_for_update(no_key=True).filter(
+        id__in=ids).values_list('id', flat=True))
+
+
+def top_k(row, k, exclude=()):
+    """Индексы и значения k наибольших элементов строки CSR-матрицы."""
+    indices, data = row.indices, row.data
+    if len(exclude):
+        keep = ~np.isin(indices, exclude)
+        indices, data = indices[keep], data[keep]
+    keep = data > 0
+    indices, data = indices[keep], data[keep]
+    if len(data) > k:
+        best = np.argpartition(-data, k)[:k]
+        indices, data = indices[best], data[best]
+    order = np.argsort(-data)
+    return indices[order], data[order]
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute similar recipes and per-user recommendations "
+        "from favorites, shopping carts and ingredient overlap")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=RECOMMENDATIONS_TOP_K,
+            help='Number of neighbours stored per recipe and per user')
+        parser.add_argument(
+            '--alpha', type=float, default=0.7,
+            help='Weight of co-interactions against ingredient overlap')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows scored and written per transaction')
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute every row instead of the ones changed '
+                 'since the previous run')
+
+    def handle(self, *args, **options):
+        self.top = options['top_k']
+        self.batch_size = options['batch_size']
+        started_at = timezone.now()
+        mark = PrecomputeMark.objects.filter(name=MARK_NAME).first()
+        since = None if options['full'] or not mark else mark.computed_at
+
+        self.recipe_ids = values_array(
+            Recipe.objects.order_by('id'), 'id')[:, 0]
+        interactions = self.load_interactions()
+        items = normalize_rows(interactions.T.tocsr())
+        ingredients = normalize_rows(self.load_ingredients())
+        similarity_rows = self.changed_recipes(since)
+        self.stdout.write(f'Recipes to score: {len(similarity_rows)}')
+        for start in range(0, len(similarity_rows), self.batch_size):
+            rows = similarity_rows[start:start + self.batch_size]
+            scores = (
+                options['alpha'] * (items[rows] @ items.T)
+                + (1 - options['alpha'])
+                * (ingredients[rows] @ ingredients.T)).tocsr()
+            self.save_similar(rows, scores)
+
+        neighbours = self.load_neighbours()
+        user_rows = self.changed_users(since)
+        self.stdout.write(f'Users to score: {len(user_rows)}')
+        for start in range(0, len(user_rows), self.batch_size):
+            rows = user_rows[start:start + self.batch_size]
+            scores = (interactions[rows] @ neighbours).tocsr()
+            self.save_recommended(rows, scores, interactions)
+
+        PrecomputeMark.objects.update_or_create(
+            name=MARK_NAME, defaults={'computed_at': started_at})
+
+    def recipe_positions(self, recipe_ids):
+        return np.searchsorted(self.recipe_ids, recipe_ids)
+
+    def known_recipes(self, recipe_ids):
+        """Маска id, которые есть в self.recipe_ids: рецепты, созданные
+           после загрузки списка, пропускаются до следующего запуска.
+        """
+        return np.isin(recipe_ids, self.recipe_ids)
+
+    def load_interactions(self):
+        """Матрица пользователи x рецепты с весами взаимодействий."""
+        parts = [
+            (values_array(model.objects.all(), 'user_id', 'recipe_id'),
+             weight)
+            for model, weight in ((Favorite, FAVORITE_WEIGHT),
+                                  (ShoppingCart, SHOPPING_CART_WEIGHT))]
+        pairs = np.concatenate([pairs for pairs, _ in parts])
+        weights = np.concatenate(
+            [np.full(len(pairs), weight) for pairs, weight in parts])
+        known = self.known_recipes(pairs[:, 1])
+        pairs, weights = pairs[known], weights[known]
+        self.user_ids, users = np.unique(pairs[:, 0], return_inverse=True)
+        return sparse.csr_matrix(
+            (weights, (users, self.recipe_positions(pairs[:, 1]))),
+            shape=(len(self.user_ids), len(self.recipe_ids)))
+
+    def load_ingredients(self):
+        """Бинарная матрица рецепты x ингредиенты."""
+        pairs = values_array(
+            IngredientRecipe.objects.all(), 'recipe_id', 'ingredient_id')
+        pairs = pairs[self.known_recipes(pairs[:, 0])]
+        return sparse.csr_matrix(
+            (np.ones(len(pairs)),
+             (self.recipe_positions(pairs[:, 0]), pairs[:, 1])),
+            shape=(len(self.recipe_ids), pairs[:, 1].max(initial=0) + 1))
+
+    def load_neighbours(self):
+        """Матрица рецепт x рецепт из сохранённых похожих рецептов."""
+        queryset = SimilarRecipe.objects.order_by('id')
+        rows = values_array(queryset, 'recipe_id', 'similar_id')
+        scores = np.fromiter(
+            queryset.values_list('score', flat=True).iterator(
+                chunk_size=10000),
+            dtype=np.float64)
+        known = (self.known_recipes(rows[:, 0])
+                 & self.known_recipes(rows[:, 1]))
+        rows, scores = rows[known], scores[known]
+        return sparse.csr_matrix(
+            (scores, (self.recipe_positions(rows[:, 0]),
+                      self.recipe_positions(rows[:, 1]))),
+            shape=(len(self.recipe_ids), len(self.recipe_ids)))
+
+    def changed_recipes(self, since):
+        if since is None:
+            return np.arange(len(self.recipe_ids))
+        recipe_ids = set(Recipe.objects.filter(
+            updated_at__gt=since).values_list('id', flat=True))
+        for model in (Favorite, ShoppingCart):
+            recipe_ids.update(model.objects.filter(
+                added_at__gt=since).values_list('recipe_id', flat=True))
+        recipe_ids = np.array(sorted(recipe_ids), dtype=np.int64)
+        return self.recipe_positions(
+            recipe_ids[self.known_recipes(recipe_ids)])
+
+    def changed_users(self, since):
+        if since is None:
+            return np.arange(len(self.user_ids))
+        user_ids = set()
+        for model in (Favorite, ShoppingCart):
+            user_ids.update(model.objects.filter(
+                added_at__gt=since).values_list('user_id', flat=True))
+        user_ids = np.array(sorted(user_ids), dtype=np.int64)
+        return np.searchsorted(
+            self.user_ids, user_ids[np.isin(user_ids, self.user_ids)])
+
+    @transaction.atomic
+    def save_similar(self, rows, scores):
+        recipe_ids = self.recipe_ids[rows].tolist()
+        similar = []
+        for row, recipe_id in enumerate(recipe_ids):
+            indices, data = top_k(scores[row], self.top, (rows[row],))
+            similar.extend(
+                SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                              score=score)
+                for similar_id, score in zip(
+                    self.recipe_ids[indices].tolist(), data.tolist()))
+        existing = lock_existing(Recipe, set(recipe_ids).union(
+            item.similar_id for item in similar))
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        SimilarRecipe.objects.bulk_create(
+            (item for item in similar
+             if item.recipe_id in existing and item.similar_id in existing),
+            batch_size=1000)
+
+    @transaction.atomic
+    def save_recommended(self, rows, scores, interactions):
+        user_ids = self.user_ids[rows].tolist()
+        recommended = []
+        for row, user_id in enumerate(user_ids):
+            indices, data = top_k(
+                scores[row], self.top, interactions[rows[row]].indices)
+            recommended.extend(
+                RecommendedRecipe(user_id=user_id, recipe_id=recipe_id,
+                                  score=score)
+                for recipe_id, score in zip(
+                    self.recipe_ids[indices].tolist(), data.tolist()))
+        users = lock_existing(User, user_ids)
+        recipes = lock_existing(
+            Recipe, {item.recipe_id for item in recommended})
+        RecommendedRecipe.objects.filter(user_id__in=user_ids).delete()
+        RecommendedRecipe.objects.bulk_create(
+            (item for item in recommended
+             if item.user_id in users and item.recipe_id in recipes),
+            batch_size=1000)
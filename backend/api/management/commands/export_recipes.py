@@ -0,0 +1,94 @@
+import json
+
+from api.utils import open_ndjson
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from recipes.models import IngredientRecipe, Recipe
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise CommandError(f'Invalid datetime: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def recipe_to_record(recipe):
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'short_link': recipe.short_link,
+        'pub_date': recipe.pub_date.isoformat(),
+        'author': {
+            'id': recipe.author.id,
+            'username': recipe.author.username,
+            'email': recipe.author.email,
+        },
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredients_in_recipe.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream recipes with authors, tags and ingredients as NDJSON, "
+        "one recipe per line")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='Output file, stdout by default')
+        parser.add_argument(
+            '--gzip', action='store_true', default=None,
+            help='Compress output; implied by a .gz output file')
+        parser.add_argument(
+            '--since', type=parse_moment,
+            help='Only recipes published at or after this datetime')
+        parser.add_argument(
+            '--until', type=parse_moment,
+            help='Only recipes published before this datetime')
+        parser.add_argument(
+            '--author', type=int, action='append', dest='authors',
+            help='Only recipes of this author id, may be repeated')
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Recipes fetched and prefetched per database round-trip')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_in_recipe',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient').order_by('id'))
+        ).order_by('id')
+        if options['since']:
+            recipes = recipes.filter(pub_date__gte=options['since'])
+        if options['until']:
+            recipes = recipes.filter(pub_date__lt=options['until'])
+        if options['authors']:
+            recipes = recipes.filter(author_id__in=options['authors'])
+
+        exported = 0
+        with open_ndjson(options['output'], 'wb', options['gzip']) as output:
+            for recipe in recipes.iterator(chunk_size=options['chunk_size']):
+                output.write(json.dumps(
+                    recipe_to_record(recipe), ensure_ascii=False
+                ).encode() + b'\n')
+                exported += 1
+        self.stderr.write(f'Exported recipes: {exported}')
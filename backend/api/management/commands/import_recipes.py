@@ -0,0 +1,251 @@
+import base64
+import binascii
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from api.cache import get_tag_map, purge_surrogate_keys
+from api.search import ingredient_index, recipe_name_index
+from api.utils import get_short_link, get_tags_mask, open_ndjson
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from PIL import Image
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+
+User = get_user_model()
+
+
+class RecordError(Exception):
+    """Запись не может быть импортирована."""
+
+
+def clean_field(model, name, value):
+    """Значение поля модели после проверки, как в форме."""
+    try:
+        return model._meta.get_field(name).clean(value, None)
+    except ValidationError as error:
+        raise RecordError(f'invalid {name}: {" ".join(error.messages)}')
+
+
+def store_image(image):
+    """Сохраняет изображение из data URI и возвращает имя файла.
+       Строка без префикса data:image считается уже сохранённым файлом.
+    """
+    if not image or not image.startswith('data:image'):
+        if not image:
+            raise RecordError('no image')
+        return image
+    try:
+        header, encoded = image.split(';base64,')
+        content = base64.b64decode(encoded)
+        Image.open(io.BytesIO(content)).verify()
+    except (ValueError, binascii.Error, OSError) as error:
+        raise RecordError(f'invalid image: {error}')
+    name = Recipe._meta.get_field('image').generate_filename(
+        None, 'imported.' + header.split('/')[-1])
+    return default_storage.save(name, ContentFile(content))
+
+
+class Command(BaseCommand):
+    help = (
+        "Import recipes from NDJSON produced by export_recipes, "
+        "in batches with bulk inserts")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input', help='NDJSON file, optionally .gz; - reads stdin')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Recipes inserted per transaction')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Threads decoding and storing images')
+        parser.add_argument(
+            '--checkpoint',
+            help='File with the last imported line; the import resumes '
+                 'after it and updates it after every batch')
+
+    def handle(self, *args, **options):
+        self.checkpoint = options['checkpoint']
+        start_line = self.read_checkpoint()
+        self.tags = get_tag_map()
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')}
+        self.imported = self.skipped = 0
+
+        with ThreadPoolExecutor(options['workers']) as self.pool:
+            with open_ndjson(options['input'], 'rb') as stream:
+                batch = []
+                for line_number, line in enumerate(stream, 1):
+                    if line_number <= start_line or not line.strip():
+                        continue
+                    batch.append((line_number, line))
+                    if len(batch) >= options['batch_size']:
+                        self.import_batch(batch)
+                        batch = []
+                if batch:
+                    self.import_batch(batch)
+        self.stderr.write(
+            f'Imported recipes: {self.imported}, skipped: {self.skipped}')
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as file:
+            return json.load(file)['line']
+
+    def write_checkpoint(self, line_number):
+        if not self.checkpoint:
+            return
+        temp_path = self.checkpoint + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({'line': line_number}, file)
+        os.replace(temp_path, self.checkpoint)
+
+    def skip(self, line_number, reason):
+        self.skipped += 1
+        self.stderr.write(f'Line {line_number} skipped: {reason}')
+
+    def resolve(self, record, authors):
+        """Проверяет запись и заменяет ссылки на id из базы.
+
+        Возвращает проверенные поля рецепта, автора, id тегов и словарь
+        id ингредиента -> количество.
+        """
+        author = authors.get(record.get('author', {}).get('email'))
+        if author is None:
+            raise RecordError('unknown author')
+        values = {
+            name: clean_field(Recipe, name, record.get(name))
+            for name in ('name', 'text', 'cooking_time')}
+        values['image'] = record.get('image')
+        if not isinstance(values['image'], str):
+            raise RecordError('no image')
+        values['short_link'] = record.get('short_link') or ''
+        try:
+            values['pub_date'] = parse_datetime(record.get('pub_date') or '')
+        except ValueError as error:
+            raise RecordError(f'invalid pub_date: {error}')
+        tag_ids = []
+        for slug in record.get('tags') or ():
+            if slug not in self.tags:
+                raise RecordError(f'unknown tag {slug}')
+            tag_ids.append(self.tags[slug])
+        ingredients = {}
+        for item in record.get('ingredients') or ():
+            key = (item.get('name'), item.get('measurement_unit'))
+            if key not in self.ingredients:
+                raise RecordError(f'unknown ingredient {key[0]}')
+            ingredients[self.ingredients[key]] = clean_field(
+                IngredientRecipe, 'amount', item.get('amount'))
+        if not tag_ids or not ingredients:
+            raise RecordError('recipe needs tags and ingredients')
+        return values, author, tag_ids, ingredients
+
+    def import_batch(self, batch):
+        records = []
+        for line_number, line in batch:
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                self.skip(line_number, f'invalid JSON: {error}')
+                continue
+            if isinstance(record, dict) and isinstance(
+                    record.get('author'), dict):
+                records.append((line_number, record))
+            else:
+                self.skip(line_number, 'not a recipe with an author')
+        authors = User.objects.in_bulk(
+            {record.get('author', {}).get('email') for _, record in records},
+            field_name='email')
+
+        resolved = []
+        for line_number, record in records:
+            try:
+                resolved.append(
+                    (line_number, *self.resolve(record, authors)))
+            except (RecordError, AttributeError, TypeError) as error:
+                self.skip(line_number, error)
+        images = self.pool.map(
+            self.store_image_safe,
+            [entry[1].get('image') for entry in resolved])
+
+        entries = []
+        for entry, image in zip(resolved, images):
+            if isinstance(image, RecordError):
+                self.skip(entry[0], image)
+            else:
+                entries.append((*entry, image))
+        if entries:
+            try:
+                self.save(entries)
+            except Exception:
+                for entry in entries:
+                    if entry[1]['image'].startswith('data:image'):
+                        default_storage.delete(entry[5])
+                raise
+        self.write_checkpoint(batch[-1][0])
+        self.stderr.write(
+            f'Line {batch[-1][0]}: imported {self.imported}, '
+            f'skipped {self.skipped}')
+
+    def store_image_safe(self, image):
+        try:
+            return store_image(image)
+        except RecordError as error:
+            return error
+
+    def get_short_links(self, records):
+        """Сохраняет короткие ссылки из файла, если они свободны,
+           остальным рецептам выдаёт новые.
+        """
+        wanted = [values['short_link'] for values in records]
+        taken = set(Recipe.objects.filter(
+            short_link__in=wanted).values_list('short_link', flat=True))
+        short_links = []
+        for short_link in wanted:
+            while not short_link or short_link in taken:
+                short_link = get_short_link(Recipe)
+            taken.add(short_link)
+            short_links.append(short_link)
+        return short_links
+
+    @transaction.atomic
+    def save(self, entries):
+        records = [entry[1] for entry in entries]
+        recipes = [
+            Recipe(
+                author=author, name=values['name'], text=values['text'],
+                cooking_time=values['cooking_time'], image=image,
+                short_link=short_link, tags_mask=get_tags_mask(tag_ids))
+            for (_, values, author, tag_ids, _, image), short_link
+            in zip(entries, self.get_short_links(records))]
+        Recipe.objects.bulk_create(recipes)
+
+        dated = []
+        for recipe, values in zip(recipes, records):
+            if values['pub_date']:
+                recipe.pub_date = values['pub_date']
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for recipe, entry in zip(recipes, entries)
+            for ingredient_id, amount in entry[4].items())
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, entry in zip(recipes, entries)
+            for tag_id in entry[3])
+        transaction.on_commit(ingredient_index.invalidate)
+        transaction.on_commit(recipe_name_index.invalidate)
+        transaction.on_commit(lambda: purge_surrogate_keys(['recipes']))
+        self.imported += len(recipes)
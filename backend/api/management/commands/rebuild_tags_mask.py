@@ -0,0 +1,10 @@
+from api.utils import refresh_tags_mask
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Recalculate Recipe.tags_mask from Recipe.tags"
+
+    def handle(self, *args, **options):
+        refresh_tags_mask(Recipe.objects.all())
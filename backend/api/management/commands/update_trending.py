@@ -0,0 +1,83 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from api.cache import purge_surrogate_keys
+from api.constants import (FAVORITE_WEIGHT, SHOPPING_CART_WEIGHT,
+                           TRENDING_HALF_LIFE_HOURS, TRENDING_MIN_SCORE)
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from recipes.models import Favorite, PrecomputeMark, Recipe, ShoppingCart
+
+MARK_NAME = 'trending'
+
+
+class Command(BaseCommand):
+    help = (
+        "Update Recipe.trending_score, a time-decayed sum of recent "
+        "favorites and shopping cart additions")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float, default=TRENDING_HALF_LIFE_HOURS,
+            help='Hours after which an interaction counts half as much')
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute scores from scratch; also drops the weight '
+                 'of removed favorites and cart items')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows written per bulk update')
+
+    def handle(self, *args, **options):
+        self.decay = math.log(2) / (options['half_life'] * 3600)
+        self.batch_size = options['batch_size']
+        now = timezone.now()
+        mark = PrecomputeMark.objects.filter(name=MARK_NAME).first()
+        with transaction.atomic():
+            if options['full'] or not mark:
+                since = now - timedelta(
+                    seconds=-math.log(TRENDING_MIN_SCORE) / self.decay)
+                Recipe.objects.filter(trending_score__gt=0).update(
+                    trending_score=0)
+            else:
+                since = mark.computed_at
+                factor = math.exp(
+                    -self.decay * (now - since).total_seconds())
+                Recipe.objects.filter(trending_score__gt=0).update(
+                    trending_score=F('trending_score') * factor)
+                Recipe.objects.filter(
+                    trending_score__lt=TRENDING_MIN_SCORE,
+                    trending_score__gt=0).update(trending_score=0)
+            updated = self.add_recent(since, now)
+            PrecomputeMark.objects.update_or_create(
+                name=MARK_NAME, defaults={'computed_at': now})
+            transaction.on_commit(
+                lambda: purge_surrogate_keys(['recipes']))
+        self.stdout.write(f'Recipes updated: {updated}')
+
+    def add_recent(self, since, now):
+        """Добавляет к оценкам вклад взаимодействий после since."""
+        recipe_ids, scores = [], []
+        for model, weight in ((Favorite, FAVORITE_WEIGHT),
+                              (ShoppingCart, SHOPPING_CART_WEIGHT)):
+            for recipe_id, added_at in model.objects.filter(
+                    added_at__gt=since, added_at__lte=now).values_list(
+                    'recipe_id', 'added_at').iterator(chunk_size=10000):
+                recipe_ids.append(recipe_id)
+                scores.append(weight * math.exp(
+                    -self.decay * (now - added_at).total_seconds()))
+        if not recipe_ids:
+            return 0
+        recipe_ids, positions = np.unique(recipe_ids, return_inverse=True)
+        deltas = np.bincount(positions, weights=scores)
+        recipes = Recipe.objects.in_bulk(recipe_ids.tolist())
+        for recipe_id, delta in zip(recipe_ids.tolist(), deltas.tolist()):
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.trending_score += delta
+        Recipe.objects.bulk_update(
+            recipes.values(), ['trending_score'], batch_size=self.batch_size)
+        return len(recipes)
@@ -0,0 +1,74 @@
+"""Метрики API в формате Prometheus.
+
+Счётчики живут в памяти процесса. Под gunicorn переменная
+PROMETHEUS_MULTIPROC_DIR включает многопроцессный режим: каждый воркер
+пишет значения в свои файлы, а /metrics суммирует файлы всех воркеров.
+"""
+import os
+import time
+
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+LABELS = ('view', 'action')
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Request latency', LABELS)
+REQUESTS = Counter(
+    'api_requests', 'Handled requests', LABELS + ('method', 'status'))
+RESPONSE_SIZE = Histogram(
+    'api_response_size_bytes', 'Response body size', LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576))
+DB_QUERIES = Histogram(
+    'api_db_queries', 'SQL queries per request', LABELS,
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+DB_QUERY_DURATION = Counter(
+    'api_db_query_duration_seconds', 'Time spent in SQL queries', LABELS)
+IN_FLIGHT = Gauge(
+    'api_requests_in_flight', 'Requests being handled',
+    multiprocess_mode='livesum')
+CACHE_LOOKUPS = Counter(
+    'api_cache_lookups', 'Cache lookups by result', ('cache', 'result'))
+
+
+def record_cache(name, hit):
+    CACHE_LOOKUPS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+def view_labels(view_func, method):
+    """Имя вьюсета и действие для вьюсетов DRF, имя функции для
+       остальных представлений.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown'), ''
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(method.lower(), '')
+
+
+class QueryStats:
+    """Обёртка execute_wrapper, считающая SQL-запросы и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def metrics(request):
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
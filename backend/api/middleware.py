@@ -0,0 +1,206 @@
+import hashlib
+import time
+from urllib.parse import parse_qsl, urlencode
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import parse_http_date_safe
+from django.utils.text import compress_sequence, compress_string
+
+from .cache import get_surrogate_versions
+from .metrics import (DB_QUERIES, DB_QUERY_DURATION, IN_FLIGHT,
+                      REQUEST_DURATION, REQUESTS, RESPONSE_SIZE, QueryStats,
+                      record_cache, view_labels)
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме запрещённых через q=0."""
+    encodings = set()
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        quality = params.strip().partition('q=')[2]
+        try:
+            if quality and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Сжимает ответы API в br или gzip в зависимости от Accept-Encoding.
+       Ответы меньше COMPRESSION_MIN_SIZE байт отдаются как есть,
+       потоковые ответы сжимаются по частям.
+    """
+
+    def process_response(self, request, response):
+        if (response.has_header('Content-Encoding')
+                or not request.path.startswith(settings.COMPRESSION_PATHS)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (not response.streaming
+                and len(response.content) < settings.COMPRESSION_MIN_SIZE):
+            return response
+
+        encodings = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if 'br' in encodings:
+            encoding = 'br'
+        elif 'gzip' in encodings:
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(
+                    response.streaming_content,
+                    settings.COMPRESSION_BROTLI_QUALITY)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                content = brotli.compress(
+                    response.content,
+                    quality=settings.COMPRESSION_BROTLI_QUALITY)
+            else:
+                content = compress_string(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        response.headers['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
+
+
+class AnonymousCacheMiddleware(MiddlewareMixin):
+    """Кеширует GET-ответы API для анонимных пользователей.
+
+    Ответ кешируется, только если вьюсет пометил его суррогатными ключами
+    (атрибут surrogate_keys). Вместе с ответом сохраняются версии ключей;
+    purge_surrogate_keys меняет версию, и все ответы с этим ключом
+    перестают отдаваться из кеша. Ответ не кешируется, если какой-либо
+    ключ сменил версию, пока ответ строился. Заголовки-валидаторы
+    сохраняются вместе с ответом, и попадание в кеш отвечает 304 на
+    условный запрос.
+    """
+    cached_headers = ('ETag', 'Last-Modified', 'Cache-Control')
+
+    def get_cache_key(self, request):
+        query = urlencode(sorted(parse_qsl(
+            request.META.get('QUERY_STRING', ''), keep_blank_values=True)))
+        raw_key = '\n'.join((
+            request.get_host(), request.path, query,
+            request.META.get('HTTP_ACCEPT', '')))
+        return 'response:' + hashlib.md5(raw_key.encode()).hexdigest()
+
+    def process_request(self, request):
+        request.response_cache_key = None
+        request.response_cache_started = time.time_ns()
+        if (request.method not in ('GET', 'HEAD')
+                or 'HTTP_AUTHORIZATION' in request.META
+                or not request.path.startswith(
+                    settings.RESPONSE_CACHE_PATHS)):
+            return None
+        request.response_cache_key = self.get_cache_key(request)
+        entry = cache.get(request.response_cache_key)
+        if entry is None or get_surrogate_versions(
+                entry['versions']) != entry['versions']:
+            record_cache('response', False)
+            return None
+        record_cache('response', True)
+        request.metrics_labels = ('AnonymousCacheMiddleware', '')
+        headers = entry.get('headers', {})
+        response = get_conditional_response(
+            request, etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(
+                headers.get('Last-Modified', '')))
+        if response is None:
+            response = HttpResponse(
+                entry['content'], content_type=entry['content_type'])
+        for name, value in headers.items():
+            response.headers[name] = value
+        patch_vary_headers(response, entry['vary'])
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    def process_response(self, request, response):
+        key = getattr(request, 'response_cache_key', None)
+        surrogate_keys = getattr(response, 'surrogate_keys', None)
+        if (not key or not surrogate_keys or response.streaming
+                or response.status_code != 200
+                or response.has_header('X-Cache')
+                or not response.get('Content-Type', '').startswith(
+                    'application/json')):
+            return response
+        versions = get_surrogate_versions(
+            surrogate_keys, request.response_cache_started)
+        if max(versions.values()) > request.response_cache_started:
+            return response
+        cache.set(key, {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'vary': [
+                header.strip() for header in
+                response.get('Vary', '').split(',') if header.strip()],
+            'headers': {
+                name: response[name] for name in self.cached_headers
+                if response.has_header(name)},
+            'versions': versions,
+        }, settings.RESPONSE_CACHE_TIMEOUT)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса: время ответа, число и время SQL-запросов,
+       размер ответа и число запросов в обработке.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_labels = ('unknown', '')
+        queries = QueryStats()
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            IN_FLIGHT.dec()
+        labels = request.metrics_labels
+        REQUEST_DURATION.labels(*labels).observe(
+            time.perf_counter() - started)
+        REQUESTS.labels(
+            *labels, request.method, response.status_code).inc()
+        DB_QUERIES.labels(*labels).observe(queries.count)
+        DB_QUERY_DURATION.labels(*labels).inc(queries.duration)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(*labels).observe(len(response.content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_labels = view_labels(view_func, request.method)
@@ -1,8 +1,170 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.paginator import (EmptyPage, InvalidPage, Page,
+                                   PageNotAnInteger, Paginator)
+from django.db import connections
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 
+from .cache import get_cached_count
 from .constants import PAGE_SIZE
+from .renderers import ORJSONRenderer
+
+
+def estimated_count(queryset):
+    """Оценка числа строк таблицы планировщиком PostgreSQL или None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedPage(Page):
+    """Страница, о наличии следующей страницы которой известно
+       из запроса, а не из count.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = has_next
+
+    def has_next(self):
+        return self.next_exists
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return (self.number - 1) * self.paginator.per_page + len(
+            self.object_list)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator с приблизительным count.
+
+    Номер страницы не сверяется с числом страниц по count: страница
+    запрашивается с одной лишней строкой, по которой видно, есть ли
+    следующая. count не меньше числа уже увиденных строк.
+    """
+
+    def validate_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        self.count = max(self.count, bottom + len(rows))
+        return EstimatedPage(
+            rows[:self.per_page], number, self, len(rows) > self.per_page)
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_estimated_count(self, object_list):
+        """Оценка планировщика для большой таблицы без фильтров или None."""
+        if not isinstance(object_list, QuerySet):
+            return None
+        query = object_list.query
+        if query.where or query.distinct:
+            return None
+        count = estimated_count(object_list)
+        if count is None or count < settings.ESTIMATED_COUNT_THRESHOLD:
+            return None
+        return count
+
+    def get_count(self, object_list):
+        """Точное число объектов, для отфильтрованного queryset -
+           закешированное.
+        """
+        if not isinstance(object_list, QuerySet):
+            return len(object_list)
+        if not object_list.query.where:
+            return object_list.count()
+        user = self.request.user
+        return get_cached_count(
+            object_list, user.pk if user.is_authenticated else None)
+
+    def django_paginator_class(self, object_list, per_page):
+        count = self.get_estimated_count(object_list)
+        if count is not None:
+            paginator = EstimatedCountPaginator(object_list, per_page)
+        else:
+            paginator = Paginator(object_list, per_page)
+            count = self.get_count(object_list)
+        paginator.count = count
+        return paginator
+
+    def should_stream(self, request):
+        """Большие страницы в JSON отдаются потоком."""
+        page_size = self.get_page_size(request)
+        return (
+            page_size is not None
+            and page_size >= settings.STREAMING_PAGE_SIZE
+            and getattr(request.accepted_renderer, 'format', None) == 'json')
+
+    def paginate_queryset_lazily(self, queryset, request):
+        """Как paginate_queryset, но без загрузки страницы в память."""
+        self.request = request
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request))
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        return self.page.object_list
+
+    def get_streaming_response(self, queryset, request, serialize):
+        """Отдаёт страницу в обычном формате count/next/previous/results,
+           сериализуя объекты порциями по STREAMING_CHUNK_SIZE. Страница
+           читается одним SELECT через iterator(), prefetch_related
+           выполняется для каждой порции.
+        """
+        objects = self.paginate_queryset_lazily(queryset, request)
+        renderer = ORJSONRenderer()
+        envelope = renderer.render({
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        })
+
+        def content():
+            yield envelope[:-1] + b',"results":['
+            chunk_size = settings.STREAMING_CHUNK_SIZE
+            rows = (
+                objects.iterator(chunk_size=chunk_size)
+                if isinstance(objects, QuerySet) else iter(objects))
+            separator = b''
+            while chunk := list(islice(rows, chunk_size)):
+                yield separator + b','.join(
+                    map(renderer.render, serialize(chunk)))
+                separator = b','
+            yield b']}'
+
+        return StreamingHttpResponse(
+            content(), content_type=renderer.media_type)
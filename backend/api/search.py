@@ -0,0 +1,364 @@
+import abc
+import bisect
+import heapq
+import re
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from recipes.models import Favorite, IngredientRecipe, Recipe
+
+from .constants import (INGREDIENT_INDEX_VERSION_KEY,
+                        LOCAL_INDEX_DELTA_TIMEOUT, LOCAL_INDEX_DELTA_WAIT,
+                        LOCAL_INDEX_MAX_DELTAS, RECIPE_NAME_INDEX_MAX_AGE,
+                        RECIPE_NAME_INDEX_VERSION_KEY)
+from .utils import values_array
+
+
+class LocalIndex(abc.ABC):
+    """Индекс в памяти процесса.
+
+    Каждый процесс строит индекс сам и следит за общей версией в кеше.
+    Изменение записывается в журнал в кеше под новой версией, и все
+    процессы, включая автора, воспроизводят его при следующем обращении.
+    Если запись журнала потеряна, журнал слишком длинный или индекс
+    старше max_age, индекс перестраивается в фоновом потоке и подменяется
+    целиком; до этого запросы обслуживает прежний индекс. Записи журнала
+    должны быть идемпотентны: после подмены они могут воспроизводиться
+    повторно.
+    """
+    version_key = None
+    max_age = None
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.built_at = None
+        self.missing_since = None
+        self.rebuilding = False
+
+    def get_shared_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, 1, None)
+            version = cache.get(self.version_key, 1)
+        return version
+
+    def bump_shared_version(self):
+        try:
+            return cache.incr(self.version_key)
+        except ValueError:
+            cache.add(self.version_key, 1, None)
+            return cache.get(self.version_key, 1)
+
+    def delta_key(self, version):
+        return f'{self.version_key}:{version}'
+
+    def ensure(self):
+        with self.lock:
+            if self.version is None:
+                self.version = self.get_shared_version()
+                self.build()
+                self.built_at = time.monotonic()
+            self.catch_up()
+            if (self.max_age is not None
+                    and time.monotonic() - self.built_at > self.max_age):
+                self.rebuild_in_background()
+
+    def catch_up(self):
+        """Воспроизводит записи журнала после локальной версии."""
+        shared = self.get_shared_version()
+        if shared < self.version:
+            # Кеш очищен: журнал потерян вместе с версией.
+            self.version = shared
+            self.rebuild_in_background()
+            return
+        if shared - self.version > LOCAL_INDEX_MAX_DELTAS:
+            self.rebuild_in_background()
+            return
+        versions = range(self.version + 1, shared + 1)
+        deltas = cache.get_many([self.delta_key(v) for v in versions])
+        for version in versions:
+            delta = deltas.get(self.delta_key(version))
+            if delta is None:
+                # Автор мог ещё не дописать запись после incr.
+                if self.missing_since is None:
+                    self.missing_since = time.monotonic()
+                elif (time.monotonic() - self.missing_since
+                      > LOCAL_INDEX_DELTA_WAIT):
+                    self.rebuild_in_background()
+                return
+            self.missing_since = None
+            name, args = delta
+            if name == 'build':
+                self.rebuild_in_background()
+            else:
+                getattr(self, name)(*args)
+            self.version = version
+
+    def apply(self, name, *args):
+        """Записывает изменение (метод name с аргументами args) в журнал
+           и применяет его локально, если индекс уже построен.
+        """
+        version = self.bump_shared_version()
+        cache.set(
+            self.delta_key(version), (name, args), LOCAL_INDEX_DELTA_TIMEOUT)
+        with self.lock:
+            if self.version is not None:
+                self.catch_up()
+
+    def invalidate(self):
+        """Просит все процессы перестроить индекс."""
+        self.apply('build')
+
+    def rebuild_in_background(self):
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def rebuild(self):
+        """Строит новый индекс без блокировки и подменяет им текущий."""
+        try:
+            fresh = type(self)()
+            try:
+                fresh.version = fresh.get_shared_version()
+                fresh.build()
+            except Exception:
+                self.rebuilding = False
+                raise
+            fresh.built_at = time.monotonic()
+            state = {
+                name: value for name, value in vars(fresh).items()
+                if name not in ('lock', 'rebuilding')}
+            with self.lock:
+                vars(self).update(state)
+                # Записи журнала, появившиеся во время построения, могут
+                # снова потребовать перестроения.
+                self.rebuilding = False
+                self.catch_up()
+        finally:
+            connection.close()
+
+    @abc.abstractmethod
+    def build(self):
+        """Строит индекс заново по данным из базы."""
+
+
+class IngredientIndex(LocalIndex):
+    """Инвертированный индекс: ингредиент -> позиции рецептов.
+
+    Позиции указывают в массив recipe_ids; при изменении рецепта старая
+    позиция помечается удалённой и рецепт получает новую позицию.
+    """
+    version_key = INGREDIENT_INDEX_VERSION_KEY
+
+    def build(self):
+        pairs = values_array(
+            IngredientRecipe.objects.all(), 'recipe_id', 'ingredient_id')
+        self.recipe_ids, positions = np.unique(
+            pairs[:, 0], return_inverse=True)
+        positions = positions.astype(np.int32)
+        self.sizes = np.bincount(positions, minlength=len(self.recipe_ids))
+        self.alive = np.ones(len(self.recipe_ids), dtype=bool)
+        self.positions = {
+            recipe_id: pos
+            for pos, recipe_id in enumerate(self.recipe_ids.tolist())}
+        order = np.argsort(pairs[:, 1], kind='stable')
+        ingredient_ids, starts = np.unique(
+            pairs[order, 1], return_index=True)
+        self.postings = dict(zip(
+            ingredient_ids.tolist(), np.split(positions[order], starts[1:])))
+
+    def _remove(self, recipe_id):
+        pos = self.positions.pop(recipe_id, None)
+        if pos is not None:
+            self.alive[pos] = False
+
+    def _update(self, recipe_id, ingredient_ids):
+        self._remove(recipe_id)
+        if not ingredient_ids:
+            return
+        pos = len(self.recipe_ids)
+        self.recipe_ids = np.append(self.recipe_ids, recipe_id)
+        self.sizes = np.append(self.sizes, len(ingredient_ids))
+        self.alive = np.append(self.alive, True)
+        self.positions[recipe_id] = pos
+        for ingredient_id in ingredient_ids:
+            self.postings[ingredient_id] = np.append(
+                self.postings.get(ingredient_id, np.empty(0, np.int32)),
+                np.int32(pos))
+
+    def _refresh(self, recipe_id):
+        self._update(recipe_id, list(IngredientRecipe.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', flat=True)))
+
+    def refresh_recipe(self, recipe_id):
+        """Перечитывает ингредиенты рецепта из базы."""
+        self.apply('_refresh', recipe_id)
+
+    def remove_recipe(self, recipe_id):
+        self.apply('_remove', recipe_id)
+
+    def search(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Возвращает список (recipe_id, coverage, missing), отсортированный
+        по доле имеющихся ингредиентов и числу недостающих.
+        """
+        self.ensure()
+        with self.lock:
+            postings = [self.postings[ingredient_id]
+                        for ingredient_id in set(ingredient_ids)
+                        if ingredient_id in self.postings]
+            if not postings:
+                return []
+            hits = np.bincount(
+                np.concatenate(postings), minlength=len(self.recipe_ids))
+            found = np.flatnonzero((hits > 0) & self.alive)
+            hits, sizes = hits[found], self.sizes[found]
+            coverage = hits / sizes
+            missing = sizes - hits
+            order = np.lexsort((missing, -coverage))
+            return list(zip(
+                self.recipe_ids[found][order].tolist(),
+                coverage[order].round(4).tolist(),
+                missing[order].tolist()))
+
+
+def name_tokens(text):
+    """Различные слова в нижнем регистре, ё заменяется на е."""
+    return tuple(dict.fromkeys(
+        re.findall(r'\w+', text.lower().replace('ё', 'е'))))
+
+
+class RecipeNameIndex(LocalIndex):
+    """Префиксный индекс по словам названий рецептов.
+
+    tokens - отсортированный список различных слов, по нему bisect
+    находит все слова с заданным префиксом, counts - число рецептов
+    с каждым словом. Списки рецептов хранят пары (-число добавлений
+    в избранное, recipe_id) по возрастанию: postings для каждого слова,
+    ranked для всех рецептов. Короткий префикс с множеством слов
+    выгоднее искать проходом по ranked, редкий - слиянием postings;
+    в обоих случаях популярные рецепты находятся первыми. Число добавлений
+    в избранное обновляется при перестроении раз в max_age.
+    """
+    version_key = RECIPE_NAME_INDEX_VERSION_KEY
+    max_age = RECIPE_NAME_INDEX_MAX_AGE
+
+    def build(self):
+        self.weights = dict(Favorite.objects.values_list(
+            'recipe_id').annotate(count=Count('id')).order_by())
+        self.names = {}
+        self.ranked = []
+        postings = {}
+        for recipe_id, name in Recipe.objects.values_list(
+                'id', 'name').iterator(chunk_size=10000):
+            tokens = name_tokens(name)
+            self.names[recipe_id] = name, tokens
+            entry = (-self.weights.get(recipe_id, 0), recipe_id)
+            self.ranked.append(entry)
+            for token in tokens:
+                postings.setdefault(token, []).append(entry)
+        self.ranked.sort()
+        for entries in postings.values():
+            entries.sort()
+        self.postings = postings
+        self.tokens = sorted(postings)
+        self.counts = np.array(
+            [len(postings[token]) for token in self.tokens], dtype=np.int64)
+
+    def entry(self, recipe_id):
+        return -self.weights.get(recipe_id, 0), recipe_id
+
+    def _remove(self, recipe_id):
+        _, tokens = self.names.pop(recipe_id, (None, ()))
+        if not tokens:
+            return
+        entry = self.entry(recipe_id)
+        self.ranked.remove(entry)
+        for token in tokens:
+            pos = bisect.bisect_left(self.tokens, token)
+            entries = self.postings[token]
+            entries.remove(entry)
+            if entries:
+                self.counts[pos] -= 1
+            else:
+                del self.postings[token]
+                del self.tokens[pos]
+                self.counts = np.delete(self.counts, pos)
+
+    def _update(self, recipe_id, name):
+        self._remove(recipe_id)
+        tokens = name_tokens(name)
+        self.names[recipe_id] = name, tokens
+        entry = self.entry(recipe_id)
+        bisect.insort(self.ranked, entry)
+        for token in tokens:
+            pos = bisect.bisect_left(self.tokens, token)
+            if token in self.postings:
+                self.counts[pos] += 1
+            else:
+                self.tokens.insert(pos, token)
+                self.counts = np.insert(self.counts, pos, 1)
+                self.postings[token] = []
+            bisect.insort(self.postings[token], entry)
+
+    def update_recipe(self, recipe_id, name):
+        with self.lock:
+            if self.version is not None and self.names.get(
+                    recipe_id, (None,))[0] == name:
+                return
+            self.apply('_update', recipe_id, name)
+
+    def remove_recipe(self, recipe_id):
+        self.apply('_remove', recipe_id)
+
+    def candidates(self, prefix, limit):
+        """Рецепты, у которых есть слово с началом prefix, начиная
+           с популярных; могут попадаться и рецепты без такого слова.
+        """
+        start = bisect.bisect_left(self.tokens, prefix)
+        stop = bisect.bisect_left(self.tokens, prefix + '\U0010ffff')
+        found = int(self.counts[start:stop].sum())
+        if not found:
+            return found, iter(())
+        if limit * len(self.names) / found < stop - start:
+            return found, iter(self.ranked)
+        return found, heapq.merge(*(
+            self.postings[token] for token in self.tokens[start:stop]))
+
+    def suggest(self, query, limit):
+        """До limit рецептов [(recipe_id, name)], в названии которых на
+           каждое слово запроса есть слово с таким началом; популярные
+           рецепты идут первыми.
+        """
+        words = name_tokens(query)
+        if not words or limit < 1:
+            return []
+        self.ensure()
+        with self.lock:
+            _, entries = min(
+                (self.candidates(word, limit) for word in words),
+                key=lambda candidates: candidates[0])
+            results, seen = [], set()
+            for _, recipe_id in entries:
+                if recipe_id in seen:
+                    continue
+                seen.add(recipe_id)
+                name, tokens = self.names[recipe_id]
+                if all(any(token.startswith(word) for token in tokens)
+                       for word in words):
+                    results.append((recipe_id, name))
+                    if len(results) == limit:
+                        break
+            return results
+
+
+ingredient_index = IngredientIndex()
+recipe_name_index = RecipeNameIndex()
@@ -1,14 +1,19 @@
 import base64
 
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.base import ContentFile
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer as CreateSerializer
 from djoser.serializers import UserSerializer as Serializer
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCart, Subscription, Tag)
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+
+from .cache import get_status_sets
+from .constants import BULK_MAX_SIZE
 
 User = get_user_model()
 
@@ -23,7 +28,38 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+def unique_error_message(model, name):
+    """Сообщение, которое выдал бы UniqueValidator для поля модели."""
+    field = model._meta.get_field(name)
+    return field.error_messages['unique'] % {
+        'model_name': model._meta.verbose_name,
+        'field_label': field.verbose_name}
+
+
+class UniqueCreateMixin(serializers.ModelSerializer):
+    """Создаёт объект одним INSERT, полагаясь на ограничение уникальности
+       в базе вместо предварительной проверки.
+
+       unique_error форматируется значениями из контекста сериализатора.
+    """
+    unique_error = 'Объект уже существует!'
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.unique_error.format(**self.context)]})
+
+
 class StatusFieldsMixin(serializers.ModelSerializer):
+    status_fields = {
+        Favorite: 'favorites',
+        ShoppingCart: 'shopping_cart',
+        Subscription: 'subscriptions',
+    }
 
     def checking_fields(self, model, obj):
         """Функция проверяет, является ли пользователь подписчиком,
@@ -32,10 +68,8 @@ class StatusFieldsMixin(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
-        if model == Subscription:
-            return request.user.subscribed_to.filter(
-                subscribed_to=obj).exists()
-        return model.objects.filter(user=request.user, recipe=obj).exists()
+        status_sets = get_status_sets(request)
+        return obj.id in getattr(status_sets, self.status_fields[model])
 
 
 class UserCreateSerializer(CreateSerializer):
@@ -46,29 +80,34 @@ class UserCreateSerializer(CreateSerializer):
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name', 'password')
 
+    def get_fields(self):
+        """Уникальность username и email проверяет база, см. create."""
+        fields = super().get_fields()
+        for field in fields.values():
+            field.validators = [
+                validator for validator in field.validators
+                if not isinstance(validator, UniqueValidator)]
+        return fields
+
     def validate(self, data):
         if data['email'] == data['username']:
             raise serializers.ValidationError(
                 'Имя пользователя не может совпадать '
                 'с адресом электронной почты!')
+        return data
 
+    def create(self, validated_data):
         try:
-            user = User.objects.get(username=data['username'])
-            if user:
-                raise serializers.ValidationError(
-                    'Имя пользователя уже занято!')
-        except ObjectDoesNotExist:
-            pass
-
-        try:
-            user = User.objects.get(email=data['email'])
-            if user:
-                raise serializers.ValidationError(
-                    'Email уже используется!')
-        except ObjectDoesNotExist:
-            pass
-
-        return data
+            return self.perform_create(validated_data)
+        except IntegrityError:
+            errors = {
+                name: [unique_error_message(User, name)]
+                for name in ('username', 'email')
+                if User.objects.filter(
+                    **{name: validated_data[name]}).exists()}
+            if not errors:
+                self.fail('cannot_create_user')
+            raise serializers.ValidationError(errors)
 
 
 class UserSerializer(Serializer, StatusFieldsMixin):
@@ -84,9 +123,19 @@ class UserSerializer(Serializer, StatusFieldsMixin):
             'last_name', 'is_subscribed', 'avatar')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return self.checking_fields(model=Subscription, obj=obj)
 
 
+class UserCompactSerializer(UserSerializer):
+    """Сокращённое представление пользователя для ?compact=1."""
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name', 'is_subscribed')
+
+
 class AvatarSerializer(UserSerializer):
     """Сериализатор для добавление аватара."""
 
@@ -206,18 +255,16 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return value
 
     def validate_ingredients(self, value):
-        ingredients_id = []
+        ingredients_id = [
+            ingredient_data['id'] for ingredient_data in value]
+        existing = set(Ingredient.objects.filter(
+            id__in=ingredients_id).values_list('id', flat=True))
 
-        for ingredient_data in value:
-            ingredient_id = ingredient_data['id']
-            try:
-                Ingredient.objects.get(id=ingredient_id)
-            except ObjectDoesNotExist:
+        for ingredient_id in ingredients_id:
+            if ingredient_id not in existing:
                 raise serializers.ValidationError(
                     f'Ингредиента с id={ingredient_id} нет в базе!')
 
-            ingredients_id.append(ingredient_id)
-
         if len(ingredients_id) != len(set(ingredients_id)):
             raise serializers.ValidationError(
                 'Повтор ингредиентов недопустим!')
@@ -231,9 +278,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ingredient_recipes = []
 
         for ingredient in ingredients:
-            current_ingredient = Ingredient.objects.get(pk=ingredient['id'])
             ingredient_recipe = IngredientRecipe(
-                ingredient=current_ingredient,
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount'])
             ingredient_recipes.append(ingredient_recipe)
@@ -257,17 +303,17 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
         self.create_tags(self.get_tags(validated_data), instance)
 
         IngredientRecipe.objects.filter(recipe=instance).delete()
         self.create_ingredients(self.get_ingredients(validated_data), instance)
 
-        instance = super().update(instance, validated_data)
-        instance.save()
-        return instance
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], 'tags', Prefetch(
+            'ingredients_in_recipe',
+            queryset=IngredientRecipe.objects.select_related('ingredient')))
         serializer = RecipeReadSerializer(instance)
         return serializer.data
 
@@ -280,22 +326,30 @@ class RecipePreviewSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class UniqueRecipeMixin(serializers.ModelSerializer):
+class RecipeCoverageSerializer(RecipePreviewSerializer):
+    """Сериализатор рецепта с долей имеющихся ингредиентов."""
+
+    coverage = serializers.SerializerMethodField()
+    missing = serializers.SerializerMethodField()
+
+    class Meta(RecipePreviewSerializer.Meta):
+        fields = RecipePreviewSerializer.Meta.fields + ('coverage', 'missing')
+
+    def get_coverage(self, obj):
+        return self.context['scores'][obj.id][0]
+
+    def get_missing(self, obj):
+        return self.context['scores'][obj.id][1]
+
+
+class UniqueRecipeMixin(UniqueCreateMixin):
     """Миксин для сериализаторов, проверяющий уникальность рецепта в модели."""
+    unique_error = 'Рецепт - {recipe.name} уже добавлен!'
 
     class Meta:
         fields = ('user', 'recipe',)
         read_only_fields = ('user', 'recipe')
 
-    def validate(self, data):
-        user = self.context.get('request').user
-        recipe = self.context.get('recipe')
-        model = self.context.get('model')
-        if model.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                f'Рецепт - {recipe.name} уже добавлен!')
-        return data
-
     def to_representation(self, instance):
         serializer = RecipePreviewSerializer(instance.recipe)
         return serializer.data
@@ -318,7 +372,7 @@ class ShoppingCartSerializer(UniqueRecipeMixin):
 class UserRecipesSerializer(UserSerializer):
     """Сериализатор для модели User и его рецептов."""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source="recipes.count")
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -335,9 +389,36 @@ class UserRecipesSerializer(UserSerializer):
         serializer = RecipePreviewSerializer(recipes, many=True)
         return serializer.data
 
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.recipes.count()
+
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class BulkIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id для массовых операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=BULK_MAX_SIZE)
+
+    def validate_ids(self, value):
+        value = list(dict.fromkeys(value))
+        model = self.context.get('model')
+        if model is None:
+            return value
+        existing = set(
+            model.objects.filter(id__in=value).values_list('id', flat=True))
+        missing = [obj_id for obj_id in value if obj_id not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                f'Объектов с id={missing} нет в базе!')
+        return value
+
+
+class SubscriptionSerializer(UniqueCreateMixin):
     """Сериализатор для модели Subscription."""
+    unique_error = 'Вы уже подписаны на {subscribed_to.username}!'
 
     class Meta:
         model = Subscription
@@ -350,11 +431,6 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         if user == subscribed_to:
             raise serializers.ValidationError(
                 'Нельзя подписаться на себя!')
-        if Subscription.objects.filter(
-            user=user, subscribed_to=subscribed_to
-        ).exists():
-            raise serializers.ValidationError(
-                f'Вы уже подписаны на {subscribed_to.username}!')
         return data
 
     def to_representation(self, instance):
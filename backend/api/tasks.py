@@ -0,0 +1,22 @@
+from django.core.management import call_command
+from jobs.queue import task
+
+
+@task('update_trending', concurrency=1, every=5 * 60)
+def update_trending():
+    call_command('update_trending')
+
+
+@task('build_recommendations', priority=-1, concurrency=1, every=60 * 60)
+def build_recommendations():
+    call_command('build_recommendations')
+
+
+@task('rebuild_tags_mask', concurrency=1)
+def rebuild_tags_mask():
+    call_command('rebuild_tags_mask')
+
+
+@task('import_recipes', priority=-1, concurrency=1)
+def import_recipes(path, checkpoint=None):
+    call_command('import_recipes', path, checkpoint=checkpoint)
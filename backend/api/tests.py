@@ -0,0 +1,267 @@
+import json
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+from api.utils import get_short_link, get_tags_mask
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, SimilarRecipe, Subscription, Tag)
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+RECIPES_COUNT = 60
+PAGE_SIZES = (1, 10, 50, settings.STREAMING_PAGE_SIZE)
+MAX_MS = 500
+# Потоковая страница повторяет prefetch_related (теги и ингредиенты
+# рецептов) для каждой порции из STREAMING_CHUNK_SIZE объектов.
+CHUNK_QUERIES = 2
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+RECIPE = {
+    'name': 'Budget new', 'text': 'Budget', 'cooking_time': 10,
+    'image': IMAGE, 'tags': '[{tag_id}]', 'ingredients': '{amounts}'}
+
+# Метод, путь, тело запроса и наибольшее число SQL-запросов.
+# {limit} заменяется на каждый размер страницы из PAGE_SIZES, число
+# запросов при этом не должно меняться. GET-запросы измеряются после
+# прогревочного запроса с очисткой кеша, чтобы не учитывать построение
+# локальных индексов процесса.
+ROUTES = (
+    ('get', '/api/recipes/?limit={limit}', None, 8),
+    ('get', '/api/recipes/?limit={limit}&is_favorited=1', None, 8),
+    ('get', '/api/recipes/?limit={limit}&is_in_shopping_cart=1', None, 8),
+    ('get', '/api/recipes/?limit={limit}&tags={tag}', None, 9),
+    ('get', '/api/recipes/?limit={limit}&author={author}', None, 9),
+    ('get', '/api/recipes/?limit={limit}&ordering=trending', None, 8),
+    ('get', '/api/recipes/{recipe}/', None, 8),
+    ('get', '/api/recipes/{recipe}/get-link/', None, 2),
+    ('get', '/api/recipes/{recipe}/similar/', None, 2),
+    ('get', '/api/recipes/recommended/?limit={limit}', None, 2),
+    ('get', '/api/recipes/status/?ids={recipes}', None, 5),
+    ('get', '/api/recipes/cookable/?limit={limit}&ingredients={ingredients}',
+     None, 2),
+    ('get', '/api/recipes/suggest/?q=budg&limit={limit}', None, 2),
+    ('get', '/api/recipes/download_shopping_cart/', None, 2),
+    ('get', '/api/recipes/download_shopping_cart/?file_format=csv', None, 2),
+    ('post', '/api/recipes/{recipe}/favorite/', None, 5),
+    ('delete', '/api/recipes/{recipe}/favorite/', None, 2),
+    ('post', '/api/recipes/{recipe}/shopping_cart/', None, 5),
+    ('delete', '/api/recipes/{recipe}/shopping_cart/', None, 2),
+    ('post', '/api/recipes/favorite/bulk/', {'ids': '[{recipes}]'}, 6),
+    ('delete', '/api/recipes/favorite/bulk/', {'ids': '[{recipes}]'}, 2),
+    ('post', '/api/recipes/shopping_cart/bulk/', {'ids': '[{recipes}]'}, 6),
+    ('delete', '/api/recipes/shopping_cart/bulk/', {'ids': '[{recipes}]'}, 2),
+    ('get', '/api/tags/', None, 2),
+    ('get', '/api/tags/{tag_id}/', None, 2),
+    ('get', '/api/ingredients/?name=ing', None, 2),
+    ('get', '/api/ingredients/{ingredient}/', None, 2),
+    ('get', '/api/users/?limit={limit}', None, 3),
+    ('get', '/api/users/{author}/', None, 2),
+    ('get', '/api/users/me/', None, 2),
+    ('get', '/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+     None, 4),
+    ('get', '/api/users/status/?ids={authors}', None, 4),
+    ('delete', '/api/users/{author}/subscribe/', None, 2),
+    ('post', '/api/users/{author}/subscribe/', None, 6),
+    ('delete', '/api/users/subscribe/bulk/', {'ids': '[{authors}]'}, 2),
+    ('post', '/api/users/subscribe/bulk/', {'ids': '[{authors}]'}, 7),
+    ('post', '/api/users/', {
+        'email': 'budget-new@example.com', 'username': 'budget-new',
+        'first_name': 'Budget', 'last_name': 'New',
+        'password': 'Budget-password-1'}, 4),
+    ('put', '/api/users/{user}/avatar/', {'avatar': IMAGE}, 4),
+    ('delete', '/api/users/{user}/avatar/', None, 4),
+    ('post', '/api/recipes/', RECIPE, 14),
+    ('patch', '/api/recipes/{own_recipe}/', RECIPE, 20),
+    ('delete', '/api/recipes/{own_recipe}/', None, 14),
+)
+
+# Маршруты анонимного пользователя: первый запрос проходит через
+# AnonymousCacheMiddleware мимо кеша, повторный - из кеша.
+ANONYMOUS_ROUTES = (
+    ('get', '/api/recipes/?limit={limit}', None, 6),
+    ('get', '/api/recipes/?limit={limit}&tags={tag}', None, 7),
+    ('get', '/api/recipes/{recipe}/', None, 6),
+    ('get', '/api/recipes/suggest/?q=budg&limit={limit}', None, 0),
+    ('get', '/api/tags/', None, 1),
+    ('get', '/api/ingredients/?name=ing', None, 1),
+    ('get', '/api/users/?limit={limit}', None, 2),
+    ('get', '/api/users/{author}/', None, 1),
+)
+
+
+def duplicate_queries(queries):
+    """SQL-запросы, повторяющиеся с точностью до чисел в параметрах."""
+    counter = Counter(
+        re.sub(r'\b\d+\b', '?', query['sql']) for query in queries)
+    return [(count, sql) for sql, count in counter.most_common() if count > 1]
+
+
+def fill(value, params):
+    """Подставляет параметры в шаблон тела запроса: строки с {...}
+       после подстановки разбираются как JSON.
+    """
+    if isinstance(value, dict):
+        return {key: fill(item, params) for key, item in value.items()}
+    if isinstance(value, str) and '{' in value:
+        return json.loads(value.format(**params))
+    return value
+
+
+def create_fixtures(recipes_count):
+    """Пользователь с избранным, корзиной и подписками и параметры путей."""
+    users = [
+        User.objects.create_user(
+            email=f'budget{i}@example.com', username=f'budget{i}',
+            first_name='Budget', last_name=str(i))
+        for i in range(10)]
+    user, authors = users[0], users[1:]
+    tags = [
+        Tag.objects.create(name=f'budget{i}', slug=f'budget{i}')
+        for i in range(3)]
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'ing budget {i}', measurement_unit='г')
+        for i in range(30))
+    recipes = Recipe.objects.bulk_create(
+        Recipe(author=authors[i % len(authors)], name=f'Budget {i}',
+               image='images/recipes/budget.jpg', text='Budget',
+               cooking_time=10, short_link=get_short_link(Recipe),
+               tags_mask=get_tags_mask([tags[i % len(tags)].id]))
+        for i in range(recipes_count))
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe=recipe, tag=tags[i % len(tags)])
+        for i, recipe in enumerate(recipes))
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(
+            recipe=recipe, amount=100,
+            ingredient=ingredients[(i + shift) % len(ingredients)])
+        for i, recipe in enumerate(recipes) for shift in range(5))
+    Favorite.objects.bulk_create(
+        Favorite(user=user, recipe=recipe) for recipe in recipes[::2])
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe=recipe) for recipe in recipes[::3])
+    Subscription.objects.bulk_create(
+        Subscription(user=user, subscribed_to=author) for author in authors)
+    SimilarRecipe.objects.bulk_create(
+        SimilarRecipe(recipe=recipes[-1], similar=recipe, score=1 / (i + 1))
+        for i, recipe in enumerate(recipes[:10]))
+    own_recipe = Recipe.objects.create(
+        author=user, name='Budget own', image='images/recipes/budget.jpg',
+        text='Budget', cooking_time=10, short_link=get_short_link(Recipe))
+    return user, {
+        'user': user.id,
+        'own_recipe': own_recipe.id,
+        'amounts': json.dumps([
+            {'id': ingredient.id, 'amount': 10}
+            for ingredient in ingredients[:10]]),
+        'recipe': recipes[-1].id,
+        'recipes': ','.join(str(recipe.id) for recipe in recipes[:20]),
+        'author': authors[0].id,
+        'authors': ','.join(str(author.id) for author in authors[1:]),
+        'tag': tags[0].slug,
+        'tag_id': tags[0].id,
+        'ingredient': ingredients[0].id,
+        'ingredients': ','.join(
+            str(ingredient.id) for ingredient in ingredients[:10]),
+    }
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'query-budgets',
+}})
+class QueryBudgetTests(TestCase):
+    """Число SQL-запросов и время ответа маршрутов API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.params = create_fixtures(RECIPES_COUNT)
+        cls.token = Token.objects.create(user=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.anonymous = self.client_class()
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token}'
+
+    def request(self, client, method, path, data, clear_cache=True):
+        if method == 'get' and clear_cache:
+            client.get(path)
+        if clear_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if data is None:
+                response = getattr(client, method)(path)
+            else:
+                response = getattr(client, method)(
+                    path, json.dumps(data), content_type='application/json')
+            if response.streaming:
+                response.streamed = b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        return response, queries.captured_queries, elapsed
+
+    def assert_within_budget(self, response, queries, elapsed, max_queries):
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(
+            len(queries), max_queries, '\n'.join(
+                f'{count} x {sql}'
+                for count, sql in duplicate_queries(queries)))
+        self.assertLessEqual(elapsed, MAX_MS)
+
+    def check_route(self, client, method, path, data, max_queries):
+        limits = PAGE_SIZES if '{limit}' in path else (None,)
+        counts = set()
+        for limit in limits:
+            url = path.format(limit=limit, **self.params)
+            body = fill(data, self.params)
+            with self.subTest(method=method, url=url):
+                response, queries, elapsed = self.request(
+                    client, method, url, body)
+                chunks = 1
+                if response.streaming:
+                    chunks = -(-len(json.loads(response.streamed)['results'])
+                               // settings.STREAMING_CHUNK_SIZE)
+                extra = CHUNK_QUERIES * (chunks - 1)
+                counts.add(len(queries) - extra)
+                self.assert_within_budget(
+                    response, queries, elapsed, max_queries + extra)
+            if client is self.anonymous:
+                with self.subTest(method=method, url=url, cache='HIT'):
+                    response, queries, elapsed = self.request(
+                        client, method, url, body, clear_cache=False)
+                    self.assert_within_budget(
+                        response, queries, elapsed, max_queries)
+                    if response.get('X-Cache') == 'HIT':
+                        self.assertEqual(len(queries), 0)
+        with self.subTest(method=method, path=path):
+            self.assertEqual(
+                len(counts), 1,
+                f'Число запросов зависит от размера страницы: '
+                f'{sorted(counts)}')
+
+    def test_routes_within_budget(self):
+        # Маршруты выполняются по порядку: удаление подписки или избранного
+        # рассчитано на объект, созданный предыдущим маршрутом.
+        for route in ROUTES:
+            self.check_route(self.client, *route)
+
+    def test_anonymous_routes_within_budget(self):
+        for route in ANONYMOUS_ROUTES:
+            self.check_route(self.anonymous, *route)
@@ -0,0 +1,128 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import SimpleRateThrottle
+
+
+def get_throttle_scope(view):
+    """Область ограничения для действия вьюсета.
+       throttle_scopes задаёт области по action, throttle_scope — общую.
+    """
+    scopes = getattr(view, 'throttle_scopes', {})
+    return scopes.get(
+        getattr(view, 'action', None), getattr(view, 'throttle_scope', None))
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Ограничение частоты запросов по алгоритму token bucket.
+
+    Скорость из DEFAULT_THROTTLE_RATES задаёт и размер корзины, и скорость
+    её пополнения. Состояние корзины хранится в кеше, поэтому при общем
+    кеше лимит действует сразу на все процессы.
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def __init__(self):
+        pass
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        self.scope = get_throttle_scope(view)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        now = self.timer()
+        tokens, updated = self.cache.get(self.key, (self.num_requests, now))
+        self.tokens = min(
+            self.num_requests,
+            tokens + (now - updated) * self.num_requests / self.duration)
+        if self.tokens < 1:
+            return self.throttle_failure()
+        self.cache.set(self.key, (self.tokens - 1, now), self.duration)
+        return True
+
+    def wait(self):
+        return (1 - self.tokens) * self.duration / self.num_requests
+
+
+class ServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен, повторите запрос позже.'
+    default_code = 'service_unavailable'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class ClosingContent:
+    """Тело потокового ответа, вызывающее on_close при закрытии ответа,
+       то есть после того, как сервер отдал тело или разорвал соединение.
+    """
+
+    def __init__(self, content, on_close):
+        self.content = content
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self):
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+
+
+class ConcurrencyLimitMixin:
+    """Миксин для вьюсетов: отклоняет запрос с 503 и Retry-After, если
+       по его области уже выполняется CONCURRENCY_LIMITS[scope] запросов.
+
+    Счётчик хранится в кеше и общий для процессов только при общем кеше,
+    см. проверку api.W001.
+    """
+    concurrency_key = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        scope = get_throttle_scope(self)
+        limit = settings.CONCURRENCY_LIMITS.get(scope)
+        if limit is None:
+            return
+        key = f'inflight:{scope}'
+        cache.add(key, 0, settings.CONCURRENCY_SLOT_TIMEOUT)
+        try:
+            in_flight = cache.incr(key)
+        except ValueError:
+            return
+        if in_flight > limit:
+            cache.decr(key)
+            raise ServiceUnavailable(wait=settings.CONCURRENCY_RETRY_AFTER)
+        self.concurrency_key = key
+
+    def release(self, key):
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        key, self.concurrency_key = self.concurrency_key, None
+        if key and getattr(response, 'streaming', False):
+            response.streaming_content = ClosingContent(
+                response.streaming_content, partial(self.release, key))
+        elif key:
+            self.release(key)
+        return response
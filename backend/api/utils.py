@@ -1,8 +1,19 @@
+import csv
+import gzip
+import io
 import random
+import sys
+from contextlib import nullcontext
 from string import ascii_letters, digits
 
-from django.shortcuts import get_object_or_404, redirect
-from recipes.models import Recipe
+import numpy as np
+from django.db.models import Sum
+from django.http import Http404
+from django.shortcuts import redirect
+from recipes.models import IngredientRecipe, Recipe
+
+from .cache import get_short_link_target
+from .constants import TAG_MASK_BITS
 
 
 def get_short_link(model):
@@ -13,8 +24,85 @@ def get_short_link(model):
     return short_link
 
 
+def values_array(queryset, *fields, chunk_size=10000):
+    """Загружает целочисленные поля queryset в массив NumPy без
+       промежуточного списка объектов.
+    """
+    values = np.fromiter(
+        (value for row in queryset.values_list(*fields).iterator(
+            chunk_size=chunk_size) for value in row),
+        dtype=np.int64)
+    return values.reshape(-1, len(fields))
+
+
+def open_ndjson(path, mode='rb', compress=None):
+    """Открывает NDJSON-файл в бинарном режиме, '-' означает stdin/stdout.
+       Сжатие gzip определяется по расширению .gz, если не задано явно.
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+    if path == '-':
+        stream = sys.stdin.buffer if 'r' in mode else sys.stdout.buffer
+        if compress:
+            return gzip.GzipFile(fileobj=stream, mode=mode)
+        return nullcontext(stream)
+    if compress:
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def get_tags_mask(tag_ids):
+    """Битовая маска тегов: тегу с id=N соответствует бит N-1.
+       Теги с id больше TAG_MASK_BITS в маску не попадают.
+    """
+    mask = 0
+    for tag_id in tag_ids:
+        if 0 < tag_id <= TAG_MASK_BITS:
+            mask |= 1 << (tag_id - 1)
+    return mask
+
+
+def refresh_tags_mask(recipes):
+    """Пересчитывает маску тегов для рецептов из queryset."""
+    tag_ids = {}
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe__in=recipes).values_list('recipe_id', 'tag_id'):
+        tag_ids.setdefault(recipe_id, []).append(tag_id)
+    for recipe in recipes.only('id', 'tags_mask').iterator():
+        mask = get_tags_mask(tag_ids.get(recipe.id, ()))
+        if recipe.tags_mask != mask:
+            Recipe.objects.filter(pk=recipe.pk).update(tags_mask=mask)
+
+
+def shopping_cart_ingredients(user):
+    """Суммарное количество ингредиентов из списка покупок."""
+    return IngredientRecipe.objects.filter(
+        recipe__shopping_cart__user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(amount_sum=Sum('amount')).order_by('ingredient__name')
+
+
+def render_shopping_cart(user, file_format):
+    """Файл списка покупок в формате txt или csv."""
+    rows = [
+        (ingredient['ingredient__name'],
+         ingredient['ingredient__measurement_unit'],
+         ingredient['amount_sum'])
+        for ingredient in shopping_cart_ingredients(user)]
+    if file_format == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        writer.writerows(rows)
+        return output.getvalue().encode()
+    return ''.join(
+        f'{name} ({measurement_unit}) - {amount}\n'
+        for name, measurement_unit, amount in rows).encode()
+
+
 def recipe_redirection(request, short_link):
-    recipe = get_object_or_404(Recipe, short_link=short_link)
-    recipe_id = recipe.id
+    recipe_id = get_short_link_target(short_link)
+    if recipe_id is None:
+        raise Http404
     return redirect(
         request.build_absolute_uri('/') + f'recipes/{recipe_id}/')
@@ -1,43 +1,139 @@
+import hashlib
+
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Value
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as ViewSet
+from jobs.queue import enqueue
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCart, Subscription, Tag)
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.response import Response
 
+from .cache import (apply_statuses, get_recipe_payload,
+                    get_shopping_cart_file, get_shopping_cart_version,
+                    get_status_sets, get_status_sets_version,
+                    invalidate_shopping_carts,
+                    invalidate_status_sets, set_recipe_payload,
+                    set_shopping_cart_file)
+from .constants import (SHOPPING_CART_FORMATS, SUGGEST_LIMIT,
+                        SUGGEST_MAX_LIMIT)
 from .filters import IngredientFilter, RecipeFilter
 from .pagination import CustomPagination
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (AvatarSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeCreateSerializer,
+from .search import ingredient_index, recipe_name_index
+from .serializers import (AvatarSerializer, BulkIdsSerializer,
+                          FavoriteSerializer, IngredientSerializer,
+                          RecipeCoverageSerializer, RecipeCreateSerializer,
+                          RecipePreviewSerializer,
                           RecipeReadSerializer, ShoppingCartSerializer,
                           SubscriptionSerializer, TagSerializer,
-                          UserRecipesSerializer, UserSerializer)
-from .utils import get_short_link
+                          UserCompactSerializer, UserRecipesSerializer,
+                          UserSerializer)
+from .throttling import ConcurrencyLimitMixin
+from .utils import get_short_link, render_shopping_cart
 
 User = get_user_model()
 
 
-class UserViewSet(ViewSet):
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'Рецепт был изменён, получите его текущую версию.'
+    default_code = 'precondition_failed'
+
+
+class BulkIdsMixin:
+    """Миксин для получения списка id в массовых операциях."""
+
+    def get_bulk_ids(self, data, model=None):
+        serializer = BulkIdsSerializer(data=data, context={'model': model})
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+    def get_query_ids(self, request, param='ids'):
+        ids = request.query_params.get(param, '')
+        return self.get_bulk_ids({'ids': ids.split(',') if ids else []})
+
+
+class StreamingListMixin:
+    """Отдаёт большие страницы списка потоком с ограниченной памятью."""
+
+    def list(self, request, *args, **kwargs):
+        if not self.paginator.should_stream(request):
+            return super().list(request, *args, **kwargs)
+        return self.paginator.get_streaming_response(
+            self.filter_queryset(self.get_queryset()), request,
+            lambda objects: self.get_serializer(objects, many=True).data)
+
+
+class SurrogateKeysMixin:
+    """Помечает ответы list и retrieve суррогатными ключами, по которым
+       AnonymousCacheMiddleware сбрасывает закешированные ответы.
+    """
+    surrogate_key = None
+
+    def get_surrogate_keys(self, data):
+        return [self.surrogate_key]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if (isinstance(response, Response) and response.status_code == 200
+                and request.method == 'GET'
+                and self.action in ('list', 'retrieve')):
+            response.surrogate_keys = self.get_surrogate_keys(response.data)
+        return response
+
+
+class UserViewSet(StreamingListMixin, BulkIdsMixin, ViewSet):
     """Вьюсет модели User."""
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     pagination_class = CustomPagination
 
+    def is_compact(self):
+        return (self.action in ('list', 'retrieve')
+                and self.request.query_params.get('compact') in ('1', 'true'))
+
+    def with_recipes(self, queryset):
+        """Подписки вместе с рецептами и их числом для UserRecipesSerializer.
+        """
+        return queryset.annotate(
+            is_subscribed=Value(True), recipes_count=Count('recipes')
+        ).prefetch_related(Prefetch('recipes', queryset=Recipe.objects.only(
+            'id', 'author', 'name', 'image', 'cooking_time')))
+
     def get_queryset(self):
         if self.action == 'subscriptions':
-            queryset = User.objects.filter(
-                subscription__user=self.request.user)
+            return self.with_recipes(User.objects.filter(
+                subscription__user=self.request.user)).order_by('id')
+        if self.action == 'subscribe':
+            return self.with_recipes(User.objects.all())
+        queryset = super().get_queryset().order_by('id')
+        if self.action not in ('list', 'retrieve', 'me'):
             return queryset
-        return super().get_queryset()
+        if self.request.user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=self.request.user, subscribed_to=OuterRef('pk'))))
+        else:
+            queryset = queryset.annotate(is_subscribed=Value(False))
+        if self.is_compact():
+            queryset = queryset.only(
+                'id', 'username', 'first_name', 'last_name')
+        return queryset
 
     def get_serializer_class(self):
+        if self.is_compact():
+            return UserCompactSerializer
         if self.action == 'avatar':
             return AvatarSerializer
         if self.action == 'subscriptions':
@@ -51,7 +147,8 @@ class UserViewSet(ViewSet):
         permission_classes=(permissions.IsAuthenticated,))
     def me(self, request):
         """Получение информации о текущем пользователе."""
-        serializer = self.get_serializer(request.user)
+        serializer = self.get_serializer(
+            self.get_queryset().get(pk=request.user.pk))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
@@ -86,41 +183,90 @@ class UserViewSet(ViewSet):
         permission_classes=(permissions.IsAuthenticated,))
     def subscribe(self, request, **kwargs):
         """Подписка на пользователя."""
+        subscribed_to = self.get_object()
         serializer = self.get_serializer(
             data=request.data,
-            context={'request': request, 'subscribed_to': self.get_object()})
+            context={'request': request, 'subscribed_to': subscribed_to})
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user, subscribed_to=self.get_object())
+        serializer.save(user=request.user, subscribed_to=subscribed_to)
+        invalidate_status_sets(request)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, **kwargs):
         """Отписка от пользователя."""
-        subscription = Subscription.objects.filter(
-            user=request.user, subscribed_to=self.get_object())
-        if not subscription.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        subscription.delete()
+        pk = self.kwargs[self.lookup_field]
+        if pk.isdigit() and Subscription.objects.filter(
+                user=request.user, subscribed_to_id=pk).delete()[0]:
+            invalidate_status_sets(request)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        self.get_object()
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    @action(
+        detail=False, methods=['post'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='subscribe/bulk')
+    def subscribe_bulk(self, request):
+        """Подписка сразу на нескольких пользователей."""
+        ids = self.get_bulk_ids(request.data, User)
+        if request.user.id in ids:
+            raise ValidationError('Нельзя подписаться на себя!')
+        with transaction.atomic():
+            Subscription.objects.bulk_create(
+                (Subscription(user=request.user, subscribed_to_id=user_id)
+                 for user_id in ids),
+                ignore_conflicts=True)
+        invalidate_status_sets(request)
+        serializer = UserRecipesSerializer(
+            self.with_recipes(User.objects.filter(id__in=ids)), many=True,
+            context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @subscribe_bulk.mapping.delete
+    def delete_subscribe_bulk(self, request):
+        """Отписка сразу от нескольких пользователей."""
+        ids = self.get_bulk_ids(request.data)
+        Subscription.objects.filter(
+            user=request.user, subscribed_to_id__in=ids).delete()
+        invalidate_status_sets(request)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False, methods=['get'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='status')
+    def statuses(self, request):
+        """Статус подписки на пользователей из списка ?ids=1,2,3."""
+        ids = self.get_query_ids(request)
+        subscribed = get_status_sets(request).subscriptions
+        return Response(
+            [{'id': user_id, 'is_subscribed': user_id in subscribed}
+             for user_id in ids],
+            status=status.HTTP_200_OK)
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(SurrogateKeysMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для модели Ingredient."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
+    throttle_scope = 'ingredients'
+    surrogate_key = 'ingredients'
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(SurrogateKeysMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для модели Tag."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
+    surrogate_key = 'tags'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConcurrencyLimitMixin, SurrogateKeysMixin,
+                    StreamingListMixin, BulkIdsMixin, viewsets.ModelViewSet):
     """Вьюсет для модели Recipe."""
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
@@ -129,10 +275,144 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = CustomPagination
+    throttle_scopes = {
+        'create': 'recipe_write',
+        'update': 'recipe_write',
+        'partial_update': 'recipe_write',
+        'download_shopping_cart': 'shopping_cart',
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.select_related('author').prefetch_related(
+                'tags', Prefetch(
+                    'ingredients_in_recipe',
+                    queryset=IngredientRecipe.objects.select_related(
+                        'ingredient')))
+        return queryset
+
+    def get_surrogate_keys(self, data):
+        if self.action == 'list':
+            recipes, keys = data['results'], {'recipes'}
+        else:
+            recipes, keys = [data], set()
+        for recipe in recipes:
+            keys.add(f'recipe:{recipe["id"]}')
+            keys.add(f'author:{recipe["author"]["id"]}')
+            keys.update(f'tag:{tag["id"]}' for tag in recipe['tags'])
+        return sorted(keys)
+
+    def get_etag(self, request, version):
+        """ETag из версии рецепта и версии флагов пользователя."""
+        user_version = (
+            get_status_sets_version(request.user.pk)
+            if request.user.is_authenticated else 0)
+        return f'"{version}.{user_version}"', user_version
+
+    def conditional_response(self, request, etag, last_modified, render):
+        """304, если у клиента актуальная версия, иначе ответ render()."""
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов с ETag по id и версиям рецептов страницы."""
+        if self.paginator.should_stream(request):
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        digest = hashlib.md5(repr((
+            self.paginator.page.paginator.count,
+            [(recipe.pk, recipe.version) for recipe in page])).encode())
+        etag, _ = self.get_etag(request, digest.hexdigest())
+        return self.conditional_response(
+            request, etag, None,
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт из общего кеша с флагами текущего пользователя.
+
+        Версия и время изменения рецепта читаются одним запросом по
+        первичному ключу. Версия служит и ключом представления в кеше,
+        и основой ETag, так что на If-None-Match или If-Modified-Since
+        с актуальными значениями отдаётся 304. Метки версий флагов -
+        время их изменения, поэтому Last-Modified учитывает и их.
+        """
+        pk = kwargs[self.lookup_field]
+        state = pk.isdigit() and Recipe.objects.filter(pk=pk).values_list(
+            'version', 'updated_at').first()
+        if not state:
+            raise NotFound
+        version, updated_at = state
+        etag, user_version = self.get_etag(request, version)
+        last_modified = int(max(updated_at.timestamp(), user_version / 1e9))
+
+        def render():
+            data = get_recipe_payload(request, pk, version)
+            if data is None:
+                data = self.get_serializer(self.get_object()).data
+                set_recipe_payload(request, pk, version, data)
+            return Response(apply_statuses(request, data))
+
+        return self.conditional_response(
+            request, etag, last_modified, render)
+
+    def check_if_match(self, request):
+        """Блокирует рецепт до конца транзакции и сверяет его версию
+           с If-Match; при несовпадении - 412, если у пользователя есть
+           права на рецепт.
+
+        Сравнивается только версия рецепта: ETag сжатых ответов
+        CompressionMiddleware делает слабыми, а версия от этого
+        не меняется.
+        """
+        if_match = request.META.get('HTTP_IF_MATCH')
+        pk = self.kwargs[self.lookup_field]
+        if if_match is None or not pk.isdigit():
+            return
+        version = Recipe.objects.select_for_update().filter(
+            pk=pk).values_list('version', flat=True).first()
+        etags = parse_etags(if_match)
+        if version is None or '*' in etags:
+            return
+        if str(version) not in (
+                etag.removeprefix('W/').strip('"').partition('.')[0]
+                for etag in etags):
+            self.get_object()
+            raise PreconditionFailed
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            self.check_if_match(request)
+            response = super().update(request, *args, **kwargs)
+        response['ETag'], _ = self.get_etag(request, self.recipe_version)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            self.check_if_match(request)
+            return super().destroy(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(
             author=self.request.user, short_link=get_short_link(Recipe))
+        transaction.on_commit(self.refresh_recommendations)
+
+    def perform_update(self, serializer):
+        self.recipe_version = serializer.save().version
+        transaction.on_commit(self.refresh_recommendations)
+
+    def refresh_recommendations(self):
+        enqueue('build_recommendations', dedupe_key='build_recommendations')
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -153,27 +433,56 @@ class RecipeViewSet(viewsets.ModelViewSet):
              + 's/' + self.get_object().short_link},
             status=status.HTTP_200_OK)
 
+    def invalidate_user_caches(self, request, model):
+        invalidate_status_sets(request)
+        if model is ShoppingCart:
+            invalidate_shopping_carts([request.user.pk])
+
     def add_recipe(self, request, model):
         """Добавляет рецепт в избранное или список покупок."""
+        recipe = self.get_object()
         serializer = self.get_serializer(
             data=request.data,
             context={
                 'request': request,
-                'recipe': self.get_object(),
+                'recipe': recipe,
                 'model': model})
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user, recipe=self.get_object())
+        serializer.save(user=request.user, recipe=recipe)
+        self.invalidate_user_caches(request, model)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def remove_recipe(self, request, model):
-        """Удаляет рецепт из избранного или списка покупок."""
-        try:
-            obj = model.objects.get(
-                user=request.user,
-                recipe=self.get_object())
-        except ObjectDoesNotExist:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        obj.delete()
+        """Удаляет рецепт из избранного или списка покупок одним DELETE.
+           Рецепт ищется только если удалять было нечего, чтобы вернуть 404.
+        """
+        pk = self.kwargs[self.lookup_field]
+        if pk.isdigit() and model.objects.filter(
+                user=request.user, recipe_id=pk).delete()[0]:
+            self.invalidate_user_caches(request, model)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        self.get_object()
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    def bulk_add_recipes(self, request, model):
+        """Добавляет несколько рецептов в избранное или список покупок."""
+        ids = self.get_bulk_ids(request.data, Recipe)
+        with transaction.atomic():
+            model.objects.bulk_create(
+                (model(user=request.user, recipe_id=recipe_id)
+                 for recipe_id in ids),
+                ignore_conflicts=True)
+        self.invalidate_user_caches(request, model)
+        serializer = RecipePreviewSerializer(
+            Recipe.objects.filter(id__in=ids), many=True,
+            context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def bulk_remove_recipes(self, request, model):
+        """Удаляет несколько рецептов из избранного или списка покупок."""
+        ids = self.get_bulk_ids(request.data)
+        model.objects.filter(user=request.user, recipe_id__in=ids).delete()
+        self.invalidate_user_caches(request, model)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -196,22 +505,142 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def delete_shopping_cart(self, request, **kwargs):
         return self.remove_recipe(request=request, model=ShoppingCart)
 
+    @action(
+        detail=False, methods=['post'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='favorite/bulk')
+    def favorite_bulk(self, request):
+        return self.bulk_add_recipes(request=request, model=Favorite)
+
+    @favorite_bulk.mapping.delete
+    def delete_favorite_bulk(self, request):
+        return self.bulk_remove_recipes(request=request, model=Favorite)
+
+    @action(
+        detail=False, methods=['post'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='shopping_cart/bulk')
+    def shopping_cart_bulk(self, request):
+        return self.bulk_add_recipes(request=request, model=ShoppingCart)
+
+    @shopping_cart_bulk.mapping.delete
+    def delete_shopping_cart_bulk(self, request):
+        return self.bulk_remove_recipes(request=request, model=ShoppingCart)
+
+    @action(
+        detail=False, methods=['get'],
+        permission_classes=(permissions.IsAuthenticated,),
+        url_path='status')
+    def statuses(self, request):
+        """Статусы рецептов из списка ?ids=1,2,3: в избранном, в списке
+           покупок и подписан ли пользователь на автора.
+        """
+        ids = self.get_query_ids(request)
+        status_sets = get_status_sets(request)
+        authors = dict(Recipe.objects.filter(
+            id__in=ids).values_list('id', 'author_id'))
+        return Response(
+            [{'id': recipe_id,
+              'is_favorited': recipe_id in status_sets.favorites,
+              'is_in_shopping_cart': recipe_id in status_sets.shopping_cart,
+              'is_subscribed': (
+                  authors.get(recipe_id) in status_sets.subscriptions)}
+             for recipe_id in ids],
+            status=status.HTTP_200_OK)
+
+    @action(
+        detail=True, methods=['get'],
+        permission_classes=(permissions.AllowAny,))
+    def similar(self, request, pk=None):
+        """Похожие рецепты, рассчитанные заранее."""
+        if not pk.isdigit():
+            raise NotFound
+        recipes = list(Recipe.objects.filter(
+            similar_to__recipe_id=pk).order_by('-similar_to__score'))
+        if not recipes and not Recipe.objects.filter(pk=pk).exists():
+            raise NotFound
+        serializer = RecipePreviewSerializer(
+            recipes, many=True, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        detail=False, methods=['get'],
+        permission_classes=(permissions.IsAuthenticated,))
+    def recommended(self, request):
+        """Рекомендованные текущему пользователю рецепты."""
+        page = self.paginate_queryset(Recipe.objects.filter(
+            recommended__user=request.user
+        ).order_by('-recommended__score'))
+        serializer = RecipePreviewSerializer(
+            page, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False, methods=['get'],
+        permission_classes=(permissions.AllowAny,))
+    def cookable(self, request):
+        """Рецепты из имеющихся ингредиентов ?ingredients=1,2,3,
+           отсортированные по доле имеющихся ингредиентов.
+        """
+        results = ingredient_index.search(
+            self.get_query_ids(request, 'ingredients'))
+        page = self.paginate_queryset(results)
+        scores = {
+            recipe_id: (coverage, missing)
+            for recipe_id, coverage, missing in page}
+        recipes = Recipe.objects.in_bulk(scores)
+        serializer = RecipeCoverageSerializer(
+            [recipes[recipe_id] for recipe_id in scores
+             if recipe_id in recipes],
+            many=True, context={'request': request, 'scores': scores})
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False, methods=['get'],
+        permission_classes=(permissions.AllowAny,))
+    def suggest(self, request):
+        """Подсказки по началу названия рецепта ?q=бор&limit=10
+           из индекса в памяти, без запросов к базе.
+        """
+        limit = request.query_params.get('limit', '')
+        limit = min(max(int(limit), 1), SUGGEST_MAX_LIMIT) if (
+            limit.isdigit()) else SUGGEST_LIMIT
+        return Response(
+            [{'id': recipe_id, 'name': name}
+             for recipe_id, name in recipe_name_index.suggest(
+                 request.query_params.get('q', ''), limit)],
+            status=status.HTTP_200_OK)
+
     @action(
         detail=False, methods=['get'],
         permission_classes=(permissions.IsAuthenticated,))
     def download_shopping_cart(self, request):
-        """Скачивание Списка покупок."""
-        indredients = IngredientRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount_sum=Sum('amount'))
-        shopping_cart = ''
-        for ingredient in indredients:
-            name = ingredient['ingredient__name']
-            measurement_unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['amount_sum']
-            shopping_cart += f'{name} ({measurement_unit}) - {amount}\n'
-        response = HttpResponse(shopping_cart, content_type='text/plain')
-        response[
-            'Content-Disposition'] = 'attachment; filename="shopping_cart.txt"'
+        """Скачивание Списка покупок: ?file_format=txt или csv.
+
+        Файл кешируется под версией списка покупок, которая меняется при
+        изменении списка или рецептов в нём. По If-None-Match с текущим
+        ETag отдаётся 304 без обращения к базе.
+        """
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_CART_FORMATS:
+            raise ValidationError({'file_format': [
+                f'Доступные форматы: {", ".join(SHOPPING_CART_FORMATS)}.']})
+        user_id = request.user.pk
+        version = get_shopping_cart_version(user_id)
+        etag = f'"{version}-{file_format}"'
+        if etag in (tag.removeprefix('W/') for tag in parse_etags(
+                request.META.get('HTTP_IF_NONE_MATCH', ''))):
+            response = HttpResponseNotModified()
+        else:
+            content = get_shopping_cart_file(user_id, version, file_format)
+            if content is None:
+                content = render_shopping_cart(request.user, file_format)
+                set_shopping_cart_file(
+                    user_id, version, file_format, content)
+            response = HttpResponse(
+                content, content_type=SHOPPING_CART_FORMATS[file_format])
+            response['Content-Disposition'] = (
+                f'attachment; filename="shopping_cart.{file_format}"')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
         return response
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -42,11 +43,13 @@ INSTALLED_APPS = [
     'django_filters',
     'rest_framework.authtoken',
     'djoser',
-    'corsheaders',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.AnonymousCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,8 +68,61 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
+
+    'DEFAULT_THROTTLE_RATES': {
+        'shopping_cart': os.getenv('THROTTLE_SHOPPING_CART', '10/min'),
+        'recipe_write': os.getenv('THROTTLE_RECIPE_WRITE', '30/min'),
+        'ingredients': os.getenv('THROTTLE_INGREDIENTS', '120/min'),
+    },
 }
 
+# Page size limits; pages of STREAMING_PAGE_SIZE items and more are streamed
+
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 1000))
+STREAMING_PAGE_SIZE = int(os.getenv('STREAMING_PAGE_SIZE', 100))
+STREAMING_CHUNK_SIZE = 50
+
+# Unfiltered lists of tables with at least ESTIMATED_COUNT_THRESHOLD rows
+# report the PostgreSQL planner estimate as count
+
+ESTIMATED_COUNT_THRESHOLD = int(os.getenv(
+    'ESTIMATED_COUNT_THRESHOLD', 100000))
+
+# Cache of anonymous API responses
+
+RESPONSE_CACHE_PATHS = ('/api/recipes/', '/api/tags/', '/api/ingredients/')
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 5 * 60))
+
+# Heavy endpoints: requests in flight per throttle scope
+
+CONCURRENCY_LIMITS = {
+    'shopping_cart': int(os.getenv('CONCURRENCY_SHOPPING_CART', 4)),
+    'recipe_write': int(os.getenv('CONCURRENCY_RECIPE_WRITE', 4)),
+}
+CONCURRENCY_RETRY_AFTER = 1
+CONCURRENCY_SLOT_TIMEOUT = 60
+
+# Response compression
+
+COMPRESSION_PATHS = ('/api/',)
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+
 
 TEMPLATES = [
     {
@@ -105,9 +161,26 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+
+# Versions, status sets, token buckets and in-flight counters live in the
+# cache, so all gunicorn workers must share it. LocMemCache is per process
+# and is only suitable for a single worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://redis:6379/0'),
     }
 }
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 100000}
 
 
 # Password validation
@@ -1,3 +1,4 @@
+from api.metrics import metrics
 from api.utils import recipe_redirection
 from django.contrib import admin
 from django.urls import include, path
@@ -6,4 +7,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('s/<str:short_link>', recipe_redirection),
+    path('metrics', metrics),
 ]
@@ -0,0 +1,66 @@
+"""Настройки gunicorn для продакшена.
+
+Приложение загружается один раз в мастер-процессе (preload_app), там же
+прогреваются кеши: воркеры получают их готовыми при форке. Соединения
+с базой мастер закрывает до форка, каждый воркер открывает своё сам
+до того, как начнёт принимать запросы.
+
+Метрики воркеров пишутся в PROMETHEUS_MULTIPROC_DIR, файлы прошлого
+запуска удаляются при старте.
+"""
+import multiprocessing
+import os
+import shutil
+import time
+
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
+
+bind = '0.0.0.0:8000'
+# Кеш в памяти процесса не общий для воркеров: версии и счётчики
+# расходились бы, поэтому с LocMemCache воркер по умолчанию один.
+shared_cache = not os.getenv('CACHE_BACKEND', '').endswith('LocMemCache')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    multiprocessing.cpu_count() * 2 + 1 if shared_cache else 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+preload_app = True
+
+started = time.perf_counter()
+
+
+def when_ready(server):
+    from api.cache import get_tag_map, warm_short_links
+    from api.search import ingredient_index, recipe_name_index
+    from django.db import DatabaseError, connections
+
+    server.log.info(
+        'Application preloaded in %.2f s', time.perf_counter() - started)
+    warm_up_started = time.perf_counter()
+    try:
+        get_tag_map()
+        ingredient_index.ensure()
+        recipe_name_index.ensure()
+        warm_short_links()
+    except DatabaseError as error:
+        server.log.warning('Cache warm-up skipped: %s', error)
+    else:
+        server.log.info(
+            'Caches warmed up in %.2f s',
+            time.perf_counter() - warm_up_started)
+    finally:
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    from django.db import connection
+
+    connection.ensure_connection()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,11 @@
+from django.contrib.admin import ModelAdmin, register
+
+from .models import Job
+
+
+@register(Job)
+class JobAdmin(ModelAdmin):
+    list_display = (
+        'name', 'status', 'priority', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'dedupe_key')
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import (claim, requeue_stale, run, schedule_periodic,
+                        worker_name)
+
+
+class Command(BaseCommand):
+    help = "Run background jobs stored in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to sleep when the queue is empty')
+        parser.add_argument(
+            '--stale-after', type=int, default=3600,
+            help='Requeue running jobs started more than this many '
+                 'seconds ago')
+        parser.add_argument(
+            '--max-jobs', type=int,
+            help='Exit after running this many jobs')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit as soon as the queue is empty')
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        processed = 0
+        self.stdout.write(f'Worker {worker} started')
+        while options['max_jobs'] is None or processed < options['max_jobs']:
+            close_old_connections()
+            requeue_stale(options['stale_after'])
+            schedule_periodic()
+            job = claim(worker)
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            started = time.monotonic()
+            run(job)
+            processed += 1
+            self.stdout.write(
+                f'{job} in {time.monotonic() - started:.2f}s')
@@ -0,0 +1,62 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+JOB_NAME_MAX_LENGTH = 128
+DEDUPE_KEY_MAX_LENGTH = 255
+WORKER_MAX_LENGTH = 64
+
+
+class Job(models.Model):
+    """Фоновая задача, которую выполняет команда run_worker."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        max_length=JOB_NAME_MAX_LENGTH, verbose_name='Задача')
+    kwargs = models.JSONField(default=dict, verbose_name='Аргументы')
+    status = models.CharField(
+        max_length=16, choices=STATUSES, default=QUEUED,
+        verbose_name='Статус')
+    priority = models.SmallIntegerField(default=0, verbose_name='Приоритет')
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3, verbose_name='Максимум попыток')
+    dedupe_key = models.CharField(
+        max_length=DEDUPE_KEY_MAX_LENGTH, blank=True,
+        verbose_name='Ключ уникальности')
+    run_at = models.DateTimeField(
+        default=timezone.now, verbose_name='Запустить после')
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Создана')
+    started_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Начата')
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Завершена')
+    worker = models.CharField(
+        max_length=WORKER_MAX_LENGTH, blank=True, verbose_name='Обработчик')
+    last_error = models.TextField(blank=True, verbose_name='Ошибка')
+
+    class Meta:
+        verbose_name = 'фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [models.Index(
+            fields=['status', '-priority', 'run_at'],
+            name='job_queue_idx')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=Q(status='queued') & ~Q(dedupe_key=''),
+                name='unique_queued_job')]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,189 @@
+import os
+import socket
+import traceback
+import zlib
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Job
+
+RETRY_DELAY = 30
+
+
+@dataclass
+class Task:
+    func: Callable
+    name: str
+    priority: int = 0
+    max_attempts: int = 3
+    concurrency: Optional[int] = None
+    every: Optional[int] = None
+
+
+registry = {}
+
+
+def task(name, priority=0, max_attempts=3, concurrency=None, every=None):
+    """Регистрирует функцию как фоновую задачу.
+
+    concurrency ограничивает число одновременно выполняемых задач с этим
+    именем, every — период в секундах для автоматического запуска.
+    """
+    def decorator(func):
+        registry[name] = Task(
+            func, name, priority, max_attempts, concurrency, every)
+        return func
+    return decorator
+
+
+def enqueue(name, kwargs=None, priority=None, dedupe_key='', delay=0):
+    """Ставит задачу в очередь и сразу возвращает управление.
+
+    Если задача с тем же dedupe_key уже ждёт в очереди, новая не создаётся.
+    """
+    registered = registry[name]
+    job = Job(
+        name=name, kwargs=kwargs or {},
+        priority=registered.priority if priority is None else priority,
+        max_attempts=registered.max_attempts, dedupe_key=dedupe_key,
+        run_at=timezone.now() + timedelta(seconds=delay))
+    if not dedupe_key:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return Job.objects.filter(
+            dedupe_key=dedupe_key, status=Job.QUEUED).first()
+    return job
+
+
+def schedule_periodic():
+    """Ставит в очередь периодические задачи, если пришло их время."""
+    now = timezone.now()
+    for registered in registry.values():
+        if not registered.every:
+            continue
+        last = Job.objects.filter(name=registered.name).exclude(
+            status=Job.FAILED).order_by('-run_at').values_list(
+            'run_at', flat=True).first()
+        if last is None or last <= now - timedelta(seconds=registered.every):
+            enqueue(registered.name, dedupe_key=f'periodic:{registered.name}')
+
+
+def requeue_stale(timeout):
+    """Возвращает в очередь задачи зависших или упавших обработчиков.
+
+    Если такая же задача (по dedupe_key) уже ждёт в очереди, зависшая
+    помечается упавшей: вторая копия в очереди не нужна.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING, started_at__lt=now - timedelta(seconds=timeout))
+    requeued = 0
+    for pk in stale.values_list('pk', flat=True):
+        try:
+            with transaction.atomic():
+                requeued += Job.objects.filter(
+                    pk=pk, status=Job.RUNNING).update(
+                    status=Job.QUEUED, worker='')
+        except IntegrityError:
+            Job.objects.filter(pk=pk, status=Job.RUNNING).update(
+                status=Job.FAILED, worker='', finished_at=now,
+                last_error='Обработчик завис, такая же задача уже в очереди.')
+    return requeued
+
+
+def lock_task(name):
+    """Блокирует имя задачи до конца транзакции, чтобы обработчики
+       по очереди проверяли её ограничение concurrency.
+
+    На PostgreSQL используется pg_advisory_xact_lock, на других базах
+    ограничение соблюдается только в пределах одного обработчика.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s)',
+                [zlib.crc32(f'jobs:{name}'.encode())])
+
+
+def claim(worker):
+    """Забирает следующую задачу из очереди.
+
+    На PostgreSQL строки блокируются через FOR UPDATE SKIP LOCKED, на SQLite
+    задачу закрепляет условный UPDATE по статусу. Число выполняемых задач
+    с ограничением concurrency считается под блокировкой имени задачи.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        running = dict(Job.objects.filter(status=Job.RUNNING).values(
+            'name').annotate(count=Count('id')).values_list('name', 'count'))
+        busy = [
+            name for name, registered in registry.items()
+            if registered.concurrency is not None
+            and running.get(name, 0) >= registered.concurrency]
+        queued = Job.objects.filter(
+            status=Job.QUEUED, run_at__lte=now, name__in=registry
+        ).order_by('-priority', 'run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            queued = queued.select_for_update(skip_locked=True)
+        while True:
+            job = queued.exclude(name__in=busy).first()
+            if job is None:
+                return None
+            concurrency = registry[job.name].concurrency
+            if concurrency is None:
+                break
+            lock_task(job.name)
+            if Job.objects.filter(
+                    name=job.name, status=Job.RUNNING).count() < concurrency:
+                break
+            busy.append(job.name)
+        if not Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, attempts=F('attempts') + 1,
+                started_at=now, worker=worker):
+            return None
+    job.refresh_from_db()
+    return job
+
+
+def run(job):
+    """Выполняет задачу; при ошибке планирует повтор с нарастающей
+       задержкой, пока не исчерпаны попытки.
+    """
+    try:
+        registry[job.name].func(**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    job.worker = ''
+    try:
+        job.save(update_fields=(
+            'status', 'run_at', 'finished_at', 'worker', 'last_error'))
+    except IntegrityError:
+        # Такая же задача уже ждёт в очереди, повтор не нужен.
+        job.status = Job.FAILED
+        job.finished_at = timezone.now()
+        job.save(update_fields=(
+            'status', 'finished_at', 'worker', 'last_error'))
+    return job
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
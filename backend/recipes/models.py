@@ -58,6 +58,8 @@ class Recipe(models.Model):
         verbose_name='Ингредиенты', related_name='recipes')
     tags = models.ManyToManyField(
         Tag, blank=False, verbose_name='Теги', related_name='recipes')
+    tags_mask = models.BigIntegerField(
+        default=0, editable=False, verbose_name='Маска тегов')
     cooking_time = models.PositiveSmallIntegerField(
         blank=False, validators=(MinValueValidator(1),),
         verbose_name='Время приготовления')
@@ -66,15 +68,40 @@ class Recipe(models.Model):
         verbose_name='Короткая ссылка')
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации')
+    trending_score = models.FloatField(
+        default=0, editable=False, verbose_name='Популярность')
+    version = models.PositiveIntegerField(
+        default=1, editable=False, verbose_name='Версия')
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'),
+            models.Index(
+                fields=['-trending_score', '-pub_date'],
+                name='recipe_trending_idx')]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Каждое сохранение существующего рецепта увеличивает version."""
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        self.version = models.F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {
+                *kwargs['update_fields'], 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=('version',))
+
 
 class IngredientRecipe(models.Model):
     """Промежуточная модель."""
@@ -105,18 +132,20 @@ class BaseUserRecipeModel(models.Model):
         User, on_delete=models.CASCADE, verbose_name='Пользователь')
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, verbose_name='Рецепт')
+    added_at = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name='Дата добавления')
 
     class Meta:
         abstract = True
         constraints = [
             models.UniqueConstraint(
-                fields=['user', 'recipe'], name='unique_constraint')]
+                fields=['user', 'recipe'], name='unique_%(class)s')]
 
 
 class ShoppingCart(BaseUserRecipeModel):
     """Модель для списка покупок."""
 
-    class Meta:
+    class Meta(BaseUserRecipeModel.Meta):
         verbose_name = 'список покупок'
         verbose_name_plural = 'Списки покупок'
         default_related_name = 'shopping_cart'
@@ -128,7 +157,7 @@ class ShoppingCart(BaseUserRecipeModel):
 class Favorite(BaseUserRecipeModel):
     """Модель для избранного."""
 
-    class Meta:
+    class Meta(BaseUserRecipeModel.Meta):
         verbose_name = 'избранное'
         verbose_name_plural = 'Избранное'
         default_related_name = 'favorite'
@@ -160,3 +189,63 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f'{self.user} подписан на {self.subscribed_to}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт, рассчитанный командой build_recommendations."""
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Рецепт')
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='similar_to',
+        verbose_name='Похожий рецепт')
+    score = models.FloatField(verbose_name='Оценка')
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similarrecipe')]
+        indexes = [models.Index(
+            fields=['recipe', '-score'], name='similarrecipe_score_idx')]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class RecommendedRecipe(models.Model):
+    """Рекомендация рецепта пользователю."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Пользователь')
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='recommended',
+        verbose_name='Рецепт')
+    score = models.FloatField(verbose_name='Оценка')
+
+    class Meta:
+        verbose_name = 'рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_recommendedrecipe')]
+        indexes = [models.Index(
+            fields=['user', '-score'], name='recommendedrecipe_score_idx')]
+
+    def __str__(self):
+        return f'{self.recipe} для {self.user}'
+
+
+class PrecomputeMark(models.Model):
+    """Время последнего запуска фонового пересчёта."""
+    name = models.CharField(
+        max_length=NAME_MAX_LENGTH, unique=True, verbose_name='Название')
+    computed_at = models.DateTimeField(verbose_name='Время пересчёта')
+
+    class Meta:
+        verbose_name = 'отметка пересчёта'
+        verbose_name_plural = 'Отметки пересчёта'
+
+    def __str__(self):
+        return f'{self.name}: {self.computed_at}'
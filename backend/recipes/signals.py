@@ -0,0 +1,180 @@
+from functools import partial
+
+from api.cache import (invalidate_recipes, invalidate_shopping_carts,
+                       invalidate_tag_map, purge_surrogate_keys,
+                       short_link_key)
+from api.search import ingredient_index, recipe_name_index
+from api.utils import get_tags_mask, refresh_tags_mask
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete,
+                                      post_migrate, post_save, pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Ingredient, IngredientRecipe, Recipe, ShoppingCart, Tag
+
+User = get_user_model()
+
+
+def invalidate_on_commit(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(partial(invalidate_recipes, recipe_ids))
+
+
+def invalidate_carts_on_commit(recipe_ids):
+    """Меняет версию списков покупок, в которых есть эти рецепты."""
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids).values_list('user_id', flat=True).distinct())
+    if user_ids:
+        transaction.on_commit(partial(invalidate_shopping_carts, user_ids))
+
+
+def version_bump():
+    """Поля для update(), увеличивающие версию рецептов."""
+    return {'version': F('version') + 1, 'updated_at': timezone.now()}
+
+
+def purge_on_commit(*surrogate_keys):
+    transaction.on_commit(partial(purge_surrogate_keys, surrogate_keys))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Поддерживает Recipe.tags_mask в соответствии с Recipe.tags,
+       увеличивает версию и сбрасывает кеш затронутых рецептов.
+    """
+    if reverse and action == 'pre_clear':
+        invalidate_on_commit(instance.recipes.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    invalidate_on_commit(pk_set or () if reverse else [instance.pk])
+    if reverse:
+        bit = get_tags_mask((instance.pk,))
+        recipes = Recipe.objects.all()
+        if action != 'post_clear':
+            recipes = recipes.filter(pk__in=pk_set)
+        if action == 'post_add':
+            recipes.update(
+                tags_mask=F('tags_mask').bitor(bit), **version_bump())
+        else:
+            recipes.update(
+                tags_mask=F('tags_mask').bitand(~bit), **version_bump())
+        return
+    if action == 'post_add':
+        instance.tags_mask |= get_tags_mask(pk_set)
+    elif action == 'post_remove':
+        instance.tags_mask &= ~get_tags_mask(pk_set)
+    else:
+        instance.tags_mask = 0
+    Recipe.objects.filter(pk=instance.pk).update(
+        tags_mask=instance.tags_mask, **version_bump())
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    transaction.on_commit(
+        partial(ingredient_index.refresh_recipe, instance.pk))
+    transaction.on_commit(partial(
+        recipe_name_index.update_recipe, instance.pk, instance.name))
+    invalidate_on_commit([instance.pk])
+    if not created:
+        invalidate_carts_on_commit([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    invalidate_carts_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(ingredient_index.remove_recipe, instance.pk))
+    transaction.on_commit(
+        partial(recipe_name_index.remove_recipe, instance.pk))
+    transaction.on_commit(
+        partial(cache.delete, short_link_key(instance.short_link)))
+    invalidate_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def ingredient_recipe_saved(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(**version_bump())
+    invalidate_on_commit([instance.recipe_id])
+    invalidate_carts_on_commit([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    purge_on_commit('ingredients')
+    if not created:
+        invalidate_on_commit(instance.recipes.values_list('id', flat=True))
+        invalidate_carts_on_commit(instance.recipes.values('id'))
+        instance.recipes.update(**version_bump())
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    """Строки IngredientRecipe удаляются каскадом без сигналов, поэтому
+       рецепты с этим ингредиентом обновляются заранее.
+    """
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if not recipe_ids:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(**version_bump())
+    invalidate_on_commit(recipe_ids)
+    invalidate_carts_on_commit(recipe_ids)
+    for recipe_id in recipe_ids:
+        transaction.on_commit(
+            partial(ingredient_index.refresh_recipe, recipe_id))
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    purge_on_commit('ingredients')
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    purge_on_commit(f'author:{instance.pk}')
+    invalidate_on_commit(instance.recipes.values_list('id', flat=True))
+    instance.recipes.update(**version_bump())
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, **kwargs):
+    invalidate_tag_map()
+    purge_on_commit('tags', f'tag:{instance.pk}')
+    invalidate_on_commit(instance.recipes.values_list('id', flat=True))
+    instance.recipes.update(**version_bump())
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    invalidate_on_commit(instance.recipes.values_list('id', flat=True))
+    instance.recipes.update(**version_bump())
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    Recipe.objects.update(
+        tags_mask=F('tags_mask').bitand(~get_tags_mask((instance.pk,))))
+    invalidate_tag_map()
+    purge_on_commit('tags', f'tag:{instance.pk}')
+
+
+@receiver(post_migrate)
+def tags_mask_backfill(sender, using, **kwargs):
+    """После migrate дозаполняет Recipe.tags_mask у рецептов, созданных
+       до появления маски: фильтр по тегам работает только по ней.
+    """
+    if sender.name != 'recipes' or Recipe._meta.db_table not in (
+            connections[using].introspection.table_names()):
+        return
+    refresh_tags_mask(Recipe.objects.using(using))